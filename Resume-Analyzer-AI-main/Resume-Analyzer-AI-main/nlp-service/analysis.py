@@ -0,0 +1,46 @@
+import os
+import prototypes
+from embedder import get_embeddings
+from skill_matcher import match_skills_per_sentence
+from section_classifier import classify_embeddings
+
+# LEXICAL_FAST_PATH=0 sends every sentence through the embedding model
+LEXICAL_FAST_PATH = os.getenv("LEXICAL_FAST_PATH", "1") != "0"
+
+def analyze_sentences(sentences):
+    # [{"text", "section", "skills", "path"}] in input order
+    # Plain skill lists and sentences with a clear section cue skip the model entirely
+    # One prototype set for the whole call, even if a reload lands halfway through
+    p = prototypes.current()
+    labels = [p["lexicon"].classify(s) for s in sentences] if LEXICAL_FAST_PATH else [None] * len(sentences)
+    remaining = [s for s, label in zip(sentences, labels) if label is None]
+
+    # One encode for everything left; both passes reuse the same matrix
+    embeddings = get_embeddings(remaining)
+    model_results = iter(zip(classify_embeddings(embeddings, p=p), match_skills_per_sentence(embeddings, p=p)))
+
+    results = []
+    for s, label in zip(sentences, labels):
+        if label is None:
+            section, skills = next(model_results)
+            results.append({"text": s, "section": section, "skills": skills, "path": "embedding"})
+        else:
+            results.append({"text": s, "section": label[0], "skills": label[1], "path": "lexical"})
+    return results
+
+def merge_skills(skills, found):
+    for skill, score in found.items():
+        skills[skill] = max(skills.get(skill, 0), score)
+    return skills
+
+def path_fractions(counts, total):
+    return {path: round(counts.get(path, 0) / total, 4) if total else 0.0 for path in ("lexical", "embedding")}
+
+def summarize(results):
+    # The /analyze response shape for a list of analyze_sentences results
+    skills, sections, paths = {}, {}, {}
+    for result in results:
+        merge_skills(skills, result["skills"])
+        sections.setdefault(result["section"], []).append(result["text"])
+        paths[result["path"]] = paths.get(result["path"], 0) + 1
+    return {"skills": skills, "sections": sections, "paths": path_fractions(paths, len(results))}
@@ -1,23 +1,120 @@
-from fastapi import FastAPI
+import os
+import json
+import time
+import threading
+import traceback
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from skill_matcher import extract_skills
-from section_classifier import classify_sentence
+import prototypes
+from analysis import analyze_sentences, summarize
+from segmenter import UnsupportedDocument, chunk_resume_text, extract_text
+from embedder import get_model, cache as embedding_cache, scheduler
 
-app = FastAPI()
+# Filled in by the warm-up thread; /ready answers 503 until model and prototypes are loaded
+readiness = {"ready": False, "model": False, "prototypes": False, "fingerprint": None, "warm_up_s": None, "error": None}
+
+# Sentences analyzed (and streamed back) per step of /analyze/stream
+STREAM_CHUNK_SENTENCES = int(os.getenv("STREAM_CHUNK_SENTENCES", "16"))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+
+# Seconds between checks of skills.json/sections.json for edits; 0 leaves reloads to POST /reload
+PROTOTYPE_WATCH_INTERVAL = float(os.getenv("PROTOTYPE_WATCH_INTERVAL", "0"))
+
+def warm_up():
+    start = time.monotonic()
+    try:
+        get_model()
+        readiness["model"] = True
+        readiness["fingerprint"] = prototypes.current()["fingerprint"]
+        readiness["prototypes"] = True
+        readiness["ready"] = True
+    except Exception as e:
+        print(traceback.format_exc())
+        readiness["error"] = str(e)
+    readiness["warm_up_s"] = round(time.monotonic() - start, 3)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve /ready immediately while the model and prototypes load in the background
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+    if PROTOTYPE_WATCH_INTERVAL > 0:
+        threading.Thread(target=prototypes.watch, args=(PROTOTYPE_WATCH_INTERVAL,), name="prototype-watch", daemon=True).start()
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 class ResumeInput(BaseModel):
     sentences: list[str]
 
 @app.post("/analyze")
 def analyze_resume(data: ResumeInput):
-    skills = extract_skills(data.sentences)
+    return summarize(analyze_sentences(data.sentences))
+
+async def read_capped(request: Request, limit: int) -> bytes:
+    # Refuse an oversized upload from its declared length, and stop reading one that lies
+    # about it (or is chunked) as soon as it passes the cap instead of buffering it whole
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise HTTPException(status_code=413, detail="Resume body too large")
+    chunks, received = [], 0
+    async for chunk in request.stream():
+        received += len(chunk)
+        if received > limit:
+            raise HTTPException(status_code=413, detail="Resume body too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@app.post("/analyze/stream")
+async def analyze_stream(request: Request):
+    # Body: {"text": "..."} JSON, plain text, or a PDF/DOCX upload; results stream back as NDJSON.
+    # Parsing and segmenting run in the threadpool so a large PDF never stalls the event loop
+    body = await read_capped(request, MAX_UPLOAD_BYTES)
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("application/json"):
+            text = json.loads(body).get("text") or ""
+        else:
+            text = await run_in_threadpool(extract_text, body, content_type)
+    except UnsupportedDocument as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Could not read resume: {e}")
+    sentences = await run_in_threadpool(chunk_resume_text, text)
+
+    def results():
+        yield json.dumps({"type": "start", "sentences": len(sentences)}) + "\n"
+        analyzed = []
+        for start in range(0, len(sentences), STREAM_CHUNK_SENTENCES):
+            for i, result in enumerate(analyze_sentences(sentences[start:start + STREAM_CHUNK_SENTENCES]), start):
+                analyzed.append(result)
+                yield json.dumps({"type": "sentence", "index": i, **result}) + "\n"
+        yield json.dumps({"type": "summary", **summarize(analyzed)}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+@app.get("/ready")
+def ready(response: Response):
+    if not readiness["ready"]:
+        response.status_code = 503
+    return readiness
+
+@app.post("/reload")
+def reload_prototypes():
+    try:
+        result = prototypes.reload()
+    except (OSError, ValueError) as e:
+        # Bad or unreadable JSON leaves the current prototypes serving
+        raise HTTPException(status_code=400, detail=f"Reload failed: {e}")
+    readiness["fingerprint"] = result["fingerprint"]
+    return result
 
-    sections = {}
-    for s in data.sentences:
-        section = classify_sentence(s)
-        sections.setdefault(section, []).append(s)
+@app.get("/cache/stats")
+def cache_stats():
+    return embedding_cache.stats()
 
-    return {
-        "skills": skills,
-        "sections": sections
-    }
+@app.get("/scheduler/stats")
+def scheduler_stats():
+    return scheduler.stats()
@@ -0,0 +1,173 @@
+"""
+Re-score a directory of stored resumes into JSONL, resumably.
+
+Run:  python batch_analyze.py ../backend/uploads --output scores.jsonl --workers 4
+
+Text extraction and segmentation run in a pool of parsing processes; embedding runs in this
+process, batched across files (--batch-sentences). Each output line is the /analyze result
+for one file. Finished files are recorded in <output>.checkpoint after their results are
+flushed, so re-running the same command skips them. The checkpoint is tied to the prototype
+fingerprint: after a skills.json/sections.json change the run starts over. A file modified
+since it was scored is scored again and appended; the last line for a file wins.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from segmenter import chunk_resume_text, extract_text
+
+
+def file_key(root, path):
+    stat = os.stat(path)
+    return f"{os.path.relpath(path, root)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def list_files(root):
+    files = []
+    for directory, _, names in os.walk(root):
+        files.extend(os.path.join(directory, n) for n in names if not n.startswith("."))
+    return sorted(files)
+
+
+def parse_file(path):
+    # Runs in a parsing worker: never touches the model
+    try:
+        with open(path, "rb") as f:
+            return {"file": path, "sentences": chunk_resume_text(extract_text(f.read()))}
+    except Exception as e:
+        return {"file": path, "sentences": [], "error": f"{type(e).__name__}: {e}"}
+
+
+def load_checkpoint(path, fingerprint):
+    # Keys of finished files, or None when there is no checkpoint for this fingerprint
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        lines = f.read().splitlines()
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError):
+        return None
+    if header.get("fingerprint") != fingerprint:
+        print(f"Checkpoint {path} is for other prototypes ({header.get('fingerprint')}); starting over")
+        return None
+    # A torn last line from a crash is simply dropped
+    return {line for line in lines[1:] if line}
+
+
+class Writer:
+    # Results first, checkpoint second, both fsynced: a crash can only repeat a batch, never lose one
+
+    def __init__(self, output, checkpoint, fingerprint, resume):
+        mode = "a" if resume else "w"
+        self.out = open(output, mode)
+        self.checkpoint = open(checkpoint, mode)
+        if not resume:
+            self.checkpoint.write(json.dumps({"fingerprint": fingerprint, "started": time.time()}) + "\n")
+            self._sync(self.checkpoint)
+
+    @staticmethod
+    def _sync(f):
+        f.flush()
+        os.fsync(f.fileno())
+
+    def write(self, rows):
+        for key, row in rows:
+            self.out.write(json.dumps(row) + "\n")
+        self._sync(self.out)
+        for key, row in rows:
+            # Unreadable files are not checkpointed, so a later run (e.g. with pypdf installed) retries them
+            if "error" not in row:
+                self.checkpoint.write(key + "\n")
+        self._sync(self.checkpoint)
+
+    def close(self):
+        self.out.close()
+        self.checkpoint.close()
+
+
+def analyze_batch(parsed):
+    # One analyze_sentences call (one encode) for every sentence of every file in the batch;
+    # imported here so spawned parsing workers never load the model stack
+    from analysis import analyze_sentences, summarize
+
+    sentences = [s for item in parsed for s in item["sentences"]]
+    results = analyze_sentences(sentences)
+    rows, offset = [], 0
+    for item in parsed:
+        count = len(item["sentences"])
+        row = {"file": item["file"], "sentences": count}
+        if "error" in item:
+            row["error"] = item["error"]
+        row.update(summarize(results[offset:offset + count]))
+        offset += count
+        rows.append((item["key"], row))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch-score stored resumes with nlp-service")
+    parser.add_argument("directory", nargs="?", default="../backend/uploads")
+    parser.add_argument("--output", default="batch_results.jsonl")
+    parser.add_argument("--checkpoint", help="defaults to <output>.checkpoint")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1), help="parsing processes")
+    parser.add_argument("--batch-sentences", type=int, default=512, help="sentences per embedding batch")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and rescore everything")
+    args = parser.parse_args()
+
+    import prototypes
+    current = prototypes.current()
+    # Results depend on the embedded prototypes and on the lexical fast path's lexicon
+    fingerprint = f"{current['fingerprint']}:{current['lexicon'].digest}"
+    checkpoint = args.checkpoint or f"{args.output}.checkpoint"
+    done = None if args.restart else load_checkpoint(checkpoint, fingerprint)
+
+    files = list_files(args.directory)
+    keys = {path: file_key(args.directory, path) for path in files}
+    todo = [path for path in files if not done or keys[path] not in done]
+    print(f"{len(files)} files under {args.directory}, {len(files) - len(todo)} already scored, {len(todo)} to go")
+    if not todo:
+        return
+
+    writer = Writer(args.output, checkpoint, fingerprint, resume=done is not None)
+    start = time.monotonic()
+    processed, errors, pending, pending_sentences = 0, 0, [], 0
+
+    def flush():
+        nonlocal processed, errors, pending, pending_sentences
+        rows = analyze_batch(pending)
+        writer.write(rows)
+        processed += len(rows)
+        errors += sum(1 for _, row in rows if "error" in row)
+        pending, pending_sentences = [], 0
+        elapsed = time.monotonic() - start
+        print(f"  {processed}/{len(todo)} files, {processed / elapsed:.2f} files/s")
+
+    try:
+        # spawn, not fork: this process already runs the model and the batching thread
+        with ProcessPoolExecutor(args.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for item in pool.map(parse_file, todo, chunksize=4):
+                item["key"] = keys[item["file"]]
+                pending.append(item)
+                pending_sentences += len(item["sentences"])
+                if pending_sentences >= args.batch_sentences:
+                    flush()
+        if pending:
+            flush()
+    except KeyboardInterrupt:
+        print(f"Interrupted after {processed} files; re-run the same command to resume")
+        sys.exit(130)
+    finally:
+        writer.close()
+
+    elapsed = time.monotonic() - start
+    print(f"Scored {processed} files ({errors} unreadable) in {elapsed:.1f}s: {processed / elapsed:.2f} files/s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+class MicroBatcher:
+    # Coalesces encode calls from concurrent requests: one worker thread gathers queued
+    # requests until max_batch_size sentences or max_wait seconds after the first one,
+    # runs a single encode and hands each request back its own rows.
+
+    def __init__(self, encode, max_batch_size=64, max_wait=0.01, window=2048):
+        self._encode = encode
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.counters = {"requests": 0, "batches": 0, "sentences": 0, "errors": 0}
+        self._batch_sizes = deque(maxlen=window)
+        self._waits = deque(maxlen=window)
+        self._encode_times = deque(maxlen=window)
+        self._queue = queue.Queue()
+        self._carry = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._thread.start()
+
+    def encode(self, texts):
+        texts = list(texts)
+        if not texts:
+            return self._encode(texts)
+        self._ensure_started()
+        future = Future()
+        self._queue.put((texts, future, time.monotonic()))
+        return future.result()
+
+    def _next_batch(self):
+        first, self._carry = self._carry or self._queue.get(), None
+        batch, size = [first], len(first[0])
+        deadline = first[2] + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                # Past the deadline, still take whatever is already queued behind a backlog
+                job = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(job[0]) > self.max_batch_size:
+                # Requests are never split; this one opens the next batch
+                self._carry = job
+                break
+            batch.append(job)
+            size += len(job[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            texts = [t for job, _, _ in batch for t in job]
+            started = time.monotonic()
+            try:
+                embeddings = np.asarray(self._encode(texts))
+            except Exception as e:
+                self.counters["errors"] += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            offset = 0
+            for job, future, _ in batch:
+                future.set_result(embeddings[offset:offset + len(job)])
+                offset += len(job)
+
+            with self._lock:
+                self.counters["requests"] += len(batch)
+                self.counters["batches"] += 1
+                self.counters["sentences"] += len(texts)
+                self._batch_sizes.append(len(texts))
+                self._encode_times.append(finished - started)
+                self._waits.extend(started - enqueued for _, _, enqueued in batch)
+
+    def stats(self):
+        with self._lock:
+            sizes = np.array(self._batch_sizes or [0], dtype=np.float64)
+            waits = np.array(self._waits or [0], dtype=np.float64) * 1000
+            encode_ms = np.array(self._encode_times or [0], dtype=np.float64) * 1000
+            return dict(
+                self.counters,
+                queue_depth=self._queue.qsize(),
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=self.max_wait * 1000,
+                batch_size_mean=round(float(sizes.mean()), 2),
+                batch_size_p95=float(np.percentile(sizes, 95)),
+                requests_per_batch=round(self.counters["requests"] / self.counters["batches"], 2) if self.counters["batches"] else 0.0,
+                queue_wait_ms_mean=round(float(waits.mean()), 3),
+                queue_wait_ms_p95=round(float(np.percentile(waits, 95)), 3),
+                encode_ms_mean=round(float(encode_ms.mean()), 3),
+            )
@@ -0,0 +1,103 @@
+"""
+Recall/latency benchmark for the skill prototype index backends, on synthetic data.
+
+Run:  python bench_prototype_index.py --sizes 1000,10000,100000 --queries 256 --k 10
+
+Prototypes are clustered like a real taxonomy (several phrasings per skill, unit-norm,
+MiniLM's 384 dimensions). Recall is the share of the exact top-k that IVF also returns;
+skill agreement compares the thresholded per-skill matches match_skills would report.
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from prototype_index import ExactIndex, IVFIndex, max_per_label
+
+
+def unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def make_prototypes(n, dim, per_skill, rng):
+    n_skills = max(1, n // per_skill)
+    centers = unit(rng.standard_normal((n_skills, dim)))
+    labels = rng.integers(0, n_skills, n)
+    return unit(centers[labels] + 0.6 * rng.standard_normal((n, dim)) / np.sqrt(dim)), labels, n_skills
+
+
+def timed(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn()
+        best = min(best, time.perf_counter() - start)
+    return out, best
+
+
+def run_size(n, args, rng):
+    prototypes, labels, n_skills = make_prototypes(n, args.dim, args.per_skill, rng)
+    picks = rng.integers(0, n, args.queries)
+    queries = unit(prototypes[picks] + 0.6 * rng.standard_normal((args.queries, args.dim)) / np.sqrt(args.dim))
+
+    exact = ExactIndex(prototypes)
+    start = time.perf_counter()
+    ivf = IVFIndex(prototypes, n_probe=args.n_probe)
+    build_s = time.perf_counter() - start
+
+    (exact_scores, exact_ids), exact_s = timed(lambda: exact.search(queries, args.k), args.repeats)
+    (ivf_scores, ivf_ids), ivf_s = timed(lambda: ivf.search(queries, args.k), args.repeats)
+
+    recall = np.mean([len(set(e) & set(a)) / len(e) for e, a in zip(exact_ids, ivf_ids)])
+    exact_skills = max_per_label(exact_scores, exact_ids, labels, n_skills, args.threshold) >= args.threshold
+    ivf_skills = max_per_label(ivf_scores, ivf_ids, labels, n_skills, args.threshold) >= args.threshold
+    union = np.sum(exact_skills | ivf_skills)
+
+    return {
+        "prototypes": n,
+        "skills": int(n_skills),
+        "ivf_lists": ivf.n_lists,
+        "n_probe": ivf.n_probe,
+        "ivf_build_s": round(build_s, 3),
+        "exact_ms": round(exact_s * 1000, 2),
+        "ivf_ms": round(ivf_s * 1000, 2),
+        "recall_at_k": round(float(recall), 4),
+        "skill_agreement": round(float(np.sum(exact_skills & ivf_skills) / union), 4) if union else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exact vs IVF skill prototype index benchmark")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--queries", type=int, default=256, help="sentences per search batch")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--n-probe", type=int, default=8)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--per-skill", type=int, default=7, help="prototype phrasings per skill")
+    parser.add_argument("--threshold", type=float, default=0.55)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for n in (int(s) for s in args.sizes.split(",")):
+        row = run_size(n, args, rng)
+        results.append(row)
+        print(f"{n:>7} prototypes: exact {row['exact_ms']:>8.2f} ms  ivf {row['ivf_ms']:>8.2f} ms  "
+              f"recall@{args.k} {row['recall_at_k']:.3f}  skills {row['skill_agreement']:.3f}  "
+              f"(build {row['ivf_build_s']}s, {row['ivf_lists']} lists)")
+
+    report = {"benchmark": "prototype_index", "queries": args.queries, "k": args.k, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Accuracy parity and throughput for the embedding backends (torch, onnx, onnx-int8).
+
+Run:  python check_embedding_backends.py --backends torch,onnx,onnx-int8 --threads 4
+
+Every backend re-encodes the skill/section prototypes and data/parity_sentences.json
+and is scored against the torch reference with the same matching /analyze uses:
+embedding cosine, section-label agreement and skill-set Jaccard. Throughput is
+sentences per second over --sentences inputs in --batch-size chunks, cache bypassed.
+Exits non-zero when a backend falls below the parity thresholds.
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from embedder import load_model, normalize
+from prototype_index import ExactIndex, max_per_label
+
+THRESHOLD = 0.55
+
+
+def load_fixtures():
+    with open("data/skills.json") as f:
+        skills = json.load(f)
+    with open("data/sections.json") as f:
+        sections = json.load(f)
+    with open("data/parity_sentences.json") as f:
+        sentences = json.load(f)
+    return skills, sections, sentences
+
+
+def analyze(model, skills, sections, sentences):
+    skill_names = list(skills)
+    skill_labels = np.array([i for i, v in enumerate(skills.values()) for _ in v], dtype=np.int64)
+    skill_matrix = normalize(model.encode([ex for v in skills.values() for ex in v]))
+    section_matrix = normalize(model.encode([" ".join(v) for v in sections.values()]))
+    embeddings = normalize(model.encode(sentences))
+
+    index = ExactIndex(skill_matrix)
+    per_sentence_skills = []
+    for row in embeddings:
+        scores, ids = index.search(row[None, :])
+        best = max_per_label(scores, ids, skill_labels, len(skill_names), THRESHOLD)
+        per_sentence_skills.append({skill_names[i] for i in np.flatnonzero(best >= THRESHOLD)})
+    section_names = list(sections)
+    labels = [section_names[i] for i in np.argmax(embeddings @ section_matrix.T, axis=1)]
+    return embeddings, labels, per_sentence_skills
+
+
+def throughput(model, sentences, total, batch_size):
+    inputs = [f"{sentences[i % len(sentences)]} ({i})" for i in range(total)]
+    model.encode(inputs[:batch_size], batch_size=batch_size)  # warm-up
+    start = time.perf_counter()
+    model.encode(inputs, batch_size=batch_size)
+    return total / (time.perf_counter() - start)
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding backend parity and throughput check")
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--sentences", type=int, default=1024, help="inputs for the throughput run")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-section-agreement", type=float, default=0.95)
+    parser.add_argument("--min-skill-jaccard", type=float, default=0.9)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    skills, sections, sentences = load_fixtures()
+    backends = args.backends.split(",")
+    if backends[0] != "torch":
+        backends.insert(0, "torch")
+
+    reference, results, failed = None, [], False
+    for backend in backends:
+        start = time.perf_counter()
+        model = load_model(backend, args.threads)
+        load_s = time.perf_counter() - start
+        embeddings, labels, skill_sets = analyze(model, skills, sections, sentences)
+        reference = reference or (embeddings, labels, skill_sets)
+
+        cosines = np.sum(embeddings * reference[0], axis=1)
+        row = {
+            "backend": backend,
+            "load_s": round(load_s, 2),
+            "sentences_per_s": round(throughput(model, sentences, args.sentences, args.batch_size), 1),
+            "mean_cosine": round(float(cosines.mean()), 5),
+            "min_cosine": round(float(cosines.min()), 5),
+            "section_agreement": round(float(np.mean([a == b for a, b in zip(labels, reference[1])])), 4),
+            "skill_jaccard": round(float(np.mean([jaccard(a, b) for a, b in zip(skill_sets, reference[2])])), 4),
+        }
+        row["parity"] = (row["section_agreement"] >= args.min_section_agreement
+                         and row["skill_jaccard"] >= args.min_skill_jaccard)
+        failed = failed or not row["parity"]
+        results.append(row)
+        print(f"{backend:>10}: {row['sentences_per_s']:>8.1f} sent/s  cosine {row['mean_cosine']:.4f} "
+              f"(min {row['min_cosine']:.4f})  sections {row['section_agreement']:.3f}  "
+              f"skills {row['skill_jaccard']:.3f}  {'ok' if row['parity'] else 'PARITY FAILED'}")
+
+    report = {"check": "embedding_backends", "fixtures": len(sentences), "threads": args.threads, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
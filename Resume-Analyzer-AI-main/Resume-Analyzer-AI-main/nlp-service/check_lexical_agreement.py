@@ -0,0 +1,68 @@
+"""
+Agreement of the lexical fast path with the embedding model on the sentences it resolves.
+
+Run:  python check_lexical_agreement.py --output lexical_agreement.json
+
+Every sentence in data/parity_sentences.json (or --sentences) that the lexicon resolves
+is also labelled by the embedding model, exactly as /analyze would with
+LEXICAL_FAST_PATH=0, and the two are compared: section-label agreement and
+skill-set Jaccard. Disagreements are listed. Exits non-zero when section agreement
+falls below --min-section-agreement.
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+import prototypes
+from embedder import get_embeddings
+from section_classifier import classify_embeddings
+from skill_matcher import match_skills_per_sentence
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lexical fast path vs embedding model agreement")
+    parser.add_argument("--sentences", default="data/parity_sentences.json")
+    parser.add_argument("--min-section-agreement", type=float, default=0.95)
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args()
+
+    with open(args.sentences) as f:
+        sentences = json.load(f)
+    p = prototypes.current()
+    resolved = [(s, label) for s in sentences if (label := p["lexicon"].classify(s)) is not None]
+
+    embeddings = get_embeddings([s for s, _ in resolved])
+    rows = []
+    for (s, (section, skills)), model_section, model_skills in zip(
+            resolved, classify_embeddings(embeddings, p=p), match_skills_per_sentence(embeddings, p=p)):
+        rows.append({"text": s, "lexical": [section, sorted(skills)], "embedding": [model_section, sorted(model_skills)],
+                     "section_match": section == model_section, "skill_jaccard": jaccard(set(skills), set(model_skills))})
+
+    report = {
+        "check": "lexical_agreement",
+        "sentences": len(sentences),
+        "lexical": len(rows),
+        "lexical_rate": round(len(rows) / len(sentences), 4) if sentences else 0.0,
+        "section_agreement": round(float(np.mean([r["section_match"] for r in rows])), 4) if rows else 1.0,
+        "skill_jaccard": round(float(np.mean([r["skill_jaccard"] for r in rows])), 4) if rows else 1.0,
+        "disagreements": [r for r in rows if not r["section_match"] or r["skill_jaccard"] < 1.0],
+    }
+    print(f"{report['lexical']}/{report['sentences']} resolved lexically ({report['lexical_rate']:.1%}); "
+          f"sections {report['section_agreement']:.3f}, skills {report['skill_jaccard']:.3f} vs the embedding model")
+    for r in report["disagreements"]:
+        print(f"  {r['text']!r}: lexical {r['lexical']} vs embedding {r['embedding']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    sys.exit(0 if report["section_agreement"] >= args.min_section_agreement else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,77 @@
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+import numpy as np
+from embedding_cache import EmbeddingCache
+from batch_scheduler import MicroBatcher
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+MODEL_NAME = "all-MiniLM-L6-v2"
+# Pre-quantized dynamic int8 export shipped in the model repo; avx2 runs on every x86 node we have
+ONNX_INT8_FILE = os.getenv("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def load_model(backend="torch", threads=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    # Imported here: pulling in torch is a large share of startup time
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return SentenceTransformer(MODEL_NAME)
+
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    model_kwargs = {"session_options": options, "provider": "CPUExecutionProvider"}
+    if backend == "onnx-int8":
+        model_kwargs["file_name"] = ONNX_INT8_FILE
+    return SentenceTransformer(MODEL_NAME, backend="onnx", model_kwargs=model_kwargs)
+
+def backend_id(backend):
+    # Quantized vectors differ slightly, so each backend gets its own cache keys
+    return MODEL_NAME if backend == "torch" else f"{MODEL_NAME}:{backend}:{ONNX_INT8_FILE if backend == 'onnx-int8' else 'fp32'}"
+
+BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+THREADS = int(os.getenv("EMBEDDING_THREADS", "0")) or None
+
+# Loaded on first encode (or by the app's warm-up), so importing the service stays cheap
+model = None
+_model_lock = threading.Lock()
+
+def get_model():
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                model = load_model(BACKEND, THREADS)
+    return model
+
+# EMBEDDING_CACHE_PATH="" keeps the cache in memory only
+cache = EmbeddingCache(
+    os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite3") or None,
+    backend_id(BACKEND),
+    max_items=int(os.getenv("EMBEDDING_CACHE_ITEMS", "50000")),
+)
+
+def encode(texts):
+    return get_model().encode(texts, convert_to_tensor=False)
+
+# Cache misses from concurrent requests share one model call; bigger batches trade latency for throughput
+scheduler = MicroBatcher(
+    encode,
+    max_batch_size=int(os.getenv("EMBED_BATCH_MAX_SIZE", "64")),
+    max_wait=float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "10")) / 1000,
+)
+BATCHING = os.getenv("EMBED_BATCHING", "1") != "0"
 
 def get_embeddings(texts):
-    return model.encode(texts, convert_to_tensor=False)
+    return cache.get_many(list(texts), scheduler.encode if BATCHING else encode)
+
+def normalize(embeddings):
+    # Unit rows turn cosine similarity into a plain matrix product
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
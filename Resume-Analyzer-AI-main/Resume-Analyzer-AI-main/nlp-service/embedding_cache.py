@@ -0,0 +1,107 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    # Content-hash keyed: an in-memory LRU in front of a SQLite table that survives restarts.
+    # Keys include the model name, so switching models never serves stale vectors.
+
+    def __init__(self, path, model_name, max_items=50000):
+        self.path = path
+        self.model_name = model_name
+        self.max_items = max_items
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "encoded_batches": 0}
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            # WAL lets several uvicorn workers read while one writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER, vector BLOB)")
+
+    def key(self, text):
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, keys):
+        found = {}
+        if self._db is None or not keys:
+            return found
+        # SQLite caps bound parameters, so look up in chunks
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._db.execute(
+                f"SELECT key, dim, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, dim, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32, count=dim)
+        return found
+
+    def _write_disk(self, items):
+        if self._db is None or not items:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, dim, vector) VALUES (?, ?, ?)",
+            [(key, len(vector), vector.tobytes()) for key, vector in items],
+        )
+
+    def get_many(self, texts, encode):
+        # encode(list_of_texts) is called at most once, with only the distinct cache misses
+        keys = [self.key(t) for t in texts]
+        vectors = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory and key not in vectors:
+                    self._memory.move_to_end(key)
+                    vectors[key] = self._memory[key]
+                    self.counters["memory_hits"] += 1
+
+            pending = list(dict.fromkeys(k for k in keys if k not in vectors))
+            for key, vector in self._read_disk(pending).items():
+                vectors[key] = vector
+                self._remember(key, vector)
+                self.counters["disk_hits"] += 1
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+
+        if missing:
+            encoded = np.asarray(encode(list(missing.values())), dtype=np.float32)
+            new_items = list(zip(missing.keys(), encoded))
+            with self._lock:
+                self.counters["misses"] += len(new_items)
+                self.counters["encoded_batches"] += 1
+                for key, vector in new_items:
+                    vector = np.ascontiguousarray(vector)
+                    vectors[key] = vector
+                    self._remember(key, vector)
+                self._write_disk(new_items)
+
+        if not keys:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([vectors[k] for k in keys])
+
+    def stats(self):
+        with self._lock:
+            lookups = self.counters["memory_hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            hits = lookups - self.counters["misses"]
+            return dict(
+                self.counters,
+                memory_items=len(self._memory),
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0,
+            )
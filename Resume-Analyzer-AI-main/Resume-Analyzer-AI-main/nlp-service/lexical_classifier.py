@@ -0,0 +1,114 @@
+import re
+import json
+import hashlib
+
+from prototype_artifact import SKILLS_PATH, SECTIONS_PATH
+
+LEXICON_PATH = "data/lexicon.json"
+# Exact mentions are certain, so they outrank any cosine score
+LEXICAL_SCORE = 1.0
+_TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9+#.'\-]*")
+
+
+def tokenize(text):
+    return [t.rstrip(".'-") for t in _TOKEN_RE.findall(text.lower())]
+
+
+def _phrases(mapping):
+    # {label: [phrase, ...]} -> {token tuple: label}
+    return {tuple(tokenize(p)): label for label, phrases in mapping.items() for p in phrases if tokenize(p)}
+
+
+def _scan(tokens, phrases, longest):
+    # Greedy longest-match; returns [(label, start, end)]
+    hits, i = [], 0
+    while i < len(tokens):
+        for n in range(min(longest, len(tokens) - i), 0, -1):
+            label = phrases.get(tuple(tokens[i:i + n]))
+            if label is not None:
+                hits.append((label, i, i + n))
+                i += n
+                break
+        else:
+            i += 1
+    return hits
+
+
+class Lexicon:
+    # Keyword/alias pre-classifier: resolves sentences that are plainly a skill list, a section
+    # header ("Education"), or mostly one unambiguous section cue ("B.Tech in Computer Science,
+    # 2021", "Skills: React, Node.js, Docker"), so only the rest needs the embedding model
+
+    def __init__(self, skill_aliases, filler, section_cues, section_examples, min_coverage=0.6, digest=None,
+                 section_context=None, headers=None):
+        self.skills = _phrases(skill_aliases)
+        self.cues = _phrases(section_cues)
+        self.filler = set(filler)
+        # Words that go with a cue's section (a field of study, a job title, a month) and so
+        # count toward its coverage without being cues themselves
+        self.context = {label: set(words) for label, words in (section_context or {}).items()}
+        self.min_coverage = min_coverage
+        self.digest = digest
+        self.section_labels = set(section_examples)
+        # A sentence identical to a sections.json example or a section header needs no model to label
+        self.exact = {" ".join(tokenize(t)): label for label, examples in section_examples.items() for t in examples}
+        self.exact.update({" ".join(tokenize(t)): label for label, names in (headers or {}).items() for t in names})
+        self._skill_len = max((len(p) for p in self.skills), default=1)
+        self._cue_len = max((len(p) for p in self.cues), default=1)
+
+    def classify(self, sentence):
+        # (section, {skill: score}) when confident, else None
+        tokens = tokenize(sentence)
+        if not tokens:
+            return None
+        skill_hits = _scan(tokens, self.skills, self._skill_len)
+        covered = set()
+        for _, start, end in skill_hits:
+            covered.update(range(start, end))
+        content = [t for i, t in enumerate(tokens) if i not in covered and t not in self.filler and not t.isdigit()]
+        coverage = len(covered) / (len(covered) + len(content)) if covered else 0.0
+        skills = {label: LEXICAL_SCORE for label, _, _ in skill_hits}
+
+        section = self.exact.get(" ".join(tokens))
+        if section is None:
+            cue_hits = _scan(tokens, self.cues, self._cue_len)
+            cued = {label for label, _, _ in cue_hits}
+            if len(cued) == 1:
+                section = cued.pop()
+                # A line led by a skills cue ("Skills: React, Docker") is a list, so names the
+                # taxonomy does not know are list items rather than a reason to ask the model
+                if section == "skills" and all(t in self.filler for t in tokens[:cue_hits[0][1]]):
+                    return section, skills
+                # One cue word in running prose ("led the education outreach team") is not
+                # enough: cue, context and skills must make up most of the sentence's content words
+                cue_tokens = {i for _, start, end in cue_hits for i in range(start, end)} - covered
+                context = self.context.get(section, set())
+                words = [t for i, t in enumerate(tokens) if i not in cue_tokens and i not in covered
+                         and t not in self.filler and not t.isdigit()]
+                claimed = len(cue_tokens) + len(covered) + sum(t in context for t in words)
+                if claimed / (len(cue_tokens) + len(covered) + len(words)) < self.min_coverage:
+                    return None
+            elif not cued and len(skills) >= 2 and coverage >= self.min_coverage and "skills" in self.section_labels:
+                # A bare list of known skills ("React, Node.js, MongoDB")
+                return "skills", skills
+            else:
+                return None
+        # A cue settles the section, but skill matching still needs the model unless the
+        # sentence is nothing more than the skills it names
+        if skills and coverage < self.min_coverage:
+            return None
+        return section, skills
+
+
+def load_lexicon(lexicon_path=LEXICON_PATH, skills_path=SKILLS_PATH, sections_path=SECTIONS_PATH, min_coverage=0.6):
+    digest = hashlib.sha1()
+    loaded = []
+    for path in (lexicon_path, skills_path, sections_path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest.update(raw)
+        loaded.append(json.loads(raw))
+    lexicon, skills, sections = loaded
+    aliases = {name: [name] + lexicon.get("skills", {}).get(name, []) for name in skills}
+    return Lexicon(aliases, lexicon.get("filler", []), lexicon.get("sections", {}), sections,
+                   min_coverage, digest.hexdigest(), lexicon.get("context", {}), lexicon.get("headers", {}))
@@ -0,0 +1,139 @@
+"""
+Precompiled skill/section prototypes: normalized embedding matrices plus labels on disk.
+
+Build ahead of deploys with  python prototype_artifact.py  (otherwise the first worker builds it).
+Each artifact lives in a directory named by a fingerprint of the embedding backend and the
+contents of skills.json and sections.json. Workers memory-map the .npy matrices read-only,
+so every process on a node shares one copy through the page cache.
+"""
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+
+import numpy as np
+
+ARTIFACT_VERSION = 1
+SKILLS_PATH = "data/skills.json"
+SECTIONS_PATH = "data/sections.json"
+DEFAULT_ROOT = os.getenv("PROTOTYPE_ARTIFACT_DIR", ".cache/prototypes")
+
+
+def fingerprint(model_id, skills_raw, sections_raw):
+    digest = hashlib.sha1(f"v{ARTIFACT_VERSION}\0{model_id}\0".encode())
+    digest.update(skills_raw)
+    digest.update(b"\0")
+    digest.update(sections_raw)
+    return digest.hexdigest()
+
+
+def _encode_changed(texts, previous_texts, previous_embeddings, encode, normalize):
+    # Rows for texts already embedded in the previous set are copied; only new text is encoded
+    known = {t: i for i, t in enumerate(previous_texts or ())}
+    missing = list(dict.fromkeys(t for t in texts if t not in known))
+    fresh = dict(zip(missing, normalize(encode(missing)))) if missing else {}
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32), 0
+    rows = [fresh[t] if t in fresh else previous_embeddings[known[t]] for t in texts]
+    return np.ascontiguousarray(np.stack(rows), dtype=np.float32), len(missing)
+
+
+def _check_examples(name, data):
+    if not isinstance(data, dict) or not all(isinstance(v, list) and all(isinstance(t, str) for t in v) for v in data.values()):
+        raise ValueError(f"{name} must map each label to a list of example strings")
+
+
+def compile_prototypes(skills, sections, encode, normalize, previous=None):
+    _check_examples("skills.json", skills)
+    _check_examples("sections.json", sections)
+    previous = previous or {}
+    skill_names = list(skills)
+    skill_texts = [ex for v in skills.values() for ex in v]
+    section_labels = list(sections)
+    section_texts = [" ".join(v) for v in sections.values()]
+    skill_embeddings, skill_encoded = _encode_changed(
+        skill_texts, previous.get("skill_texts"), previous.get("skill_embeddings"), encode, normalize)
+    section_embeddings, section_encoded = _encode_changed(
+        section_texts, previous.get("section_texts"), previous.get("section_embeddings"), encode, normalize)
+    return {
+        "skill_names": skill_names,
+        "skill_texts": skill_texts,
+        # Column of skill_names for every prototype row
+        "skill_labels": np.array([i for i, v in enumerate(skills.values()) for _ in v], dtype=np.int64),
+        "skill_embeddings": skill_embeddings,
+        "section_labels": section_labels,
+        "section_texts": section_texts,
+        "section_embeddings": section_embeddings,
+        "encoded": skill_encoded + section_encoded,
+    }
+
+
+def save_artifact(prototypes, root, digest):
+    target = os.path.join(root, digest)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    for name in ("skill_embeddings", "section_embeddings", "skill_labels"):
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(prototypes[name]))
+    manifest = {k: prototypes[k] for k in ("skill_names", "skill_texts", "section_labels", "section_texts")}
+    manifest.update(version=ARTIFACT_VERSION, fingerprint=digest)
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f)
+    try:
+        # Directory rename is atomic; if another worker got there first, keep theirs
+        os.rename(tmp, target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return target
+
+
+def open_artifact(path):
+    with open(os.path.join(path, "manifest.json")) as f:
+        manifest = json.load(f)
+    if manifest.get("version") != ARTIFACT_VERSION:
+        raise ValueError(f"artifact version {manifest.get('version')} != {ARTIFACT_VERSION}")
+    prototypes = {k: manifest[k] for k in ("skill_names", "skill_texts", "section_labels", "section_texts", "fingerprint")}
+    for name in ("skill_embeddings", "section_embeddings", "skill_labels"):
+        prototypes[name] = np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+    return prototypes
+
+
+def read_sources(skills_path=SKILLS_PATH, sections_path=SECTIONS_PATH):
+    with open(skills_path, "rb") as f:
+        skills_raw = f.read()
+    with open(sections_path, "rb") as f:
+        sections_raw = f.read()
+    return skills_raw, sections_raw
+
+
+def load_prototypes(model_id, encode, normalize, root=DEFAULT_ROOT, skills_path=SKILLS_PATH, sections_path=SECTIONS_PATH, previous=None):
+    # Returns the prototype set for the current sources, re-encoding only when the fingerprint is new
+    # (and then only the texts `previous` does not already hold)
+    skills_raw, sections_raw = read_sources(skills_path, sections_path)
+    digest = fingerprint(model_id, skills_raw, sections_raw)
+    path = os.path.join(root, digest)
+    if root and os.path.isdir(path):
+        try:
+            return open_artifact(path)
+        except Exception as e:
+            print(f"Rebuilding unreadable prototype artifact {path}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+
+    prototypes = compile_prototypes(json.loads(skills_raw), json.loads(sections_raw), encode, normalize, previous)
+    prototypes["fingerprint"] = digest
+    if root:
+        try:
+            return dict(open_artifact(save_artifact(prototypes, root, digest)), encoded=prototypes["encoded"])
+        except OSError as e:
+            print(f"Could not write prototype artifact under {root}: {e}")
+    return prototypes
+
+
+if __name__ == "__main__":
+    from embedder import BACKEND, backend_id, get_embeddings, normalize
+
+    root = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_ROOT
+    prototypes = load_prototypes(backend_id(BACKEND), get_embeddings, normalize, root)
+    print(f"Prototype artifact {prototypes['fingerprint']}: {len(prototypes['skill_texts'])} skill prototypes, "
+          f"{len(prototypes['section_labels'])} sections under {root}")
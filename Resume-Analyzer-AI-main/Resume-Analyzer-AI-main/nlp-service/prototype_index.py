@@ -0,0 +1,111 @@
+import numpy as np
+
+# Below this many prototypes a full matrix product beats any index
+IVF_MIN_PROTOTYPES = 5000
+
+
+def _top_k(sims, k):
+    # Row-wise top-k of a (queries, candidates) matrix, best first
+    if k >= sims.shape[1]:
+        order = np.argsort(-sims, axis=1)
+    else:
+        part = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.take_along_axis(part, np.argsort(-np.take_along_axis(sims, part, axis=1), axis=1), axis=1)
+    return np.take_along_axis(sims, order, axis=1), order
+
+
+class ExactIndex:
+    # Brute force over unit-norm prototype rows; search returns every row unless k is given
+
+    def __init__(self, vectors):
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.default_k = len(self.vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def search(self, queries, k=None):
+        k = min(k or self.default_k, len(self.vectors))
+        if not len(queries) or not k:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        return _top_k(queries @ self.vectors.T, k)
+
+
+class IVFIndex:
+    # Inverted-file index: spherical k-means cells, each query scans only the n_probe closest cells
+
+    def __init__(self, vectors, n_lists=None, n_probe=8, iterations=10, seed=0, default_k=64):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        self.n_lists = n_lists or max(1, int(4 * np.sqrt(len(vectors))))
+        self.n_probe = n_probe
+        self.default_k = default_k
+        self.centroids = self._train(vectors, iterations, np.random.default_rng(seed))
+
+        assign = self._assign(vectors)
+        # Rows are stored grouped by cell so each probe reads one contiguous slice
+        self.ids = np.argsort(assign, kind="stable")
+        self.vectors = vectors[self.ids]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=self.n_lists))])
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _assign(self, vectors, chunk=8192):
+        return np.concatenate([
+            np.argmax(vectors[i:i + chunk] @ self.centroids.T, axis=1) for i in range(0, len(vectors), chunk)
+        ]) if len(vectors) else np.zeros(0, np.int64)
+
+    def _train(self, vectors, iterations, rng):
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), self.n_lists * 64), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), self.n_lists, replace=len(sample) < self.n_lists)].copy()
+        for _ in range(iterations):
+            assign = self._assign(sample)
+            counts = np.bincount(assign, minlength=self.n_lists)
+            order = np.argsort(assign, kind="stable")
+            sums = np.zeros_like(self.centroids)
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            filled = counts > 0
+            sums[filled] = np.add.reduceat(sample[order], starts[filled], axis=0)
+            # Empty cells restart from a random sample point
+            empty = counts == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]
+            self.centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+        return self.centroids
+
+    def search(self, queries, k=None):
+        k = k or self.default_k
+        n = len(queries)
+        scores = np.full((n, k), -np.inf, dtype=np.float32)
+        ids = np.full((n, k), -1, dtype=np.int64)
+        if not n or not len(self.vectors):
+            return scores, ids
+        probes = _top_k(queries @ self.centroids.T, min(self.n_probe, self.n_lists))[1]
+        for q, cells in enumerate(probes):
+            # Cells are contiguous slices, so scoring them needs no gather copy
+            spans = [(self.offsets[c], self.offsets[c + 1]) for c in cells if self.offsets[c + 1] > self.offsets[c]]
+            if not spans:
+                continue
+            sims = np.concatenate([self.vectors[a:b] @ queries[q] for a, b in spans])
+            rows = np.concatenate([self.ids[a:b] for a, b in spans])
+            top_scores, top = _top_k(sims[None, :], min(k, len(sims)))
+            scores[q, :top.shape[1]] = top_scores[0]
+            ids[q, :top.shape[1]] = rows[top[0]]
+        return scores, ids
+
+
+def build_index(vectors, backend="auto", **options):
+    if backend == "auto":
+        backend = "ivf" if len(vectors) >= IVF_MIN_PROTOTYPES else "exact"
+    if backend == "exact":
+        return ExactIndex(vectors)
+    if backend == "ivf":
+        return IVFIndex(vectors, **options)
+    raise ValueError(f"Unknown prototype index backend: {backend}")
+
+
+def max_per_label(scores, ids, labels, n_labels, threshold):
+    # Best score per label over every (query, neighbour) pair at or above threshold
+    best = np.full(n_labels, -np.inf, dtype=np.float32)
+    keep = (ids >= 0) & (scores >= threshold)
+    np.maximum.at(best, labels[ids[keep]], scores[keep])
+    return best
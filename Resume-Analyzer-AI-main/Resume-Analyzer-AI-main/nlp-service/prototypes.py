@@ -0,0 +1,82 @@
+import os
+import time
+import threading
+
+from embedder import BACKEND, backend_id, get_embeddings, normalize
+from prototype_artifact import SKILLS_PATH, SECTIONS_PATH, load_prototypes
+from prototype_index import build_index
+from lexical_classifier import LEXICON_PATH, load_lexicon
+
+# SKILL_INDEX=exact|ivf|auto; auto switches to IVF once the taxonomy is large
+SKILL_INDEX = os.getenv("SKILL_INDEX", "auto")
+LEXICAL_MIN_COVERAGE = float(os.getenv("LEXICAL_MIN_COVERAGE", "0.6"))
+
+_current = None
+_lock = threading.Lock()
+# Serializes reloads without ever blocking readers of _current
+_reload_lock = threading.Lock()
+
+def _build(previous=None):
+    prototypes = load_prototypes(backend_id(BACKEND), get_embeddings, normalize, previous=previous)
+    prototypes["skill_index"] = build_index(prototypes["skill_embeddings"], SKILL_INDEX)
+    prototypes["lexicon"] = load_lexicon(min_coverage=LEXICAL_MIN_COVERAGE)
+    prototypes["loaded_at"] = time.time()
+    return prototypes
+
+def load():
+    global _current
+    with _lock:
+        _current = _build()
+        return _current
+
+def current():
+    # Readers take one reference per request, so they always see a complete prototype set
+    global _current
+    if _current is None:
+        with _lock:
+            if _current is None:
+                _current = _build()
+    return _current
+
+def loaded():
+    return _current is not None
+
+def reload():
+    # Builds the new set off to the side, encoding only added or changed examples, then swaps it in
+    global _current
+    with _reload_lock:
+        previous = current()
+        start = time.monotonic()
+        prototypes = _build(previous)
+        changed = (prototypes["fingerprint"] != previous["fingerprint"]
+                   or prototypes["lexicon"].digest != previous["lexicon"].digest)
+        if changed:
+            _current = prototypes
+        return {
+            "changed": changed,
+            "fingerprint": _current["fingerprint"],
+            "encoded": prototypes.get("encoded", 0) if changed else 0,
+            "skills": len(_current["skill_names"]),
+            "skill_prototypes": len(_current["skill_texts"]),
+            "sections": len(_current["section_labels"]),
+            "reload_s": round(time.monotonic() - start, 3),
+        }
+
+def _source_mtimes():
+    return tuple(os.stat(p).st_mtime_ns if os.path.exists(p) else None for p in (SKILLS_PATH, SECTIONS_PATH, LEXICON_PATH))
+
+def watch(interval):
+    # Polls the source files so every worker picks up edits, not just the one that served /reload
+    seen = _source_mtimes()
+    while True:
+        time.sleep(interval)
+        mtimes = _source_mtimes()
+        if mtimes == seen:
+            continue
+        seen = mtimes
+        try:
+            result = reload()
+            if result["changed"]:
+                print(f"Reloaded prototypes {result['fingerprint']}: {result['encoded']} examples encoded")
+        except Exception as e:
+            print(f"Keeping current prototypes, reload failed: {e}")
@@ -1,16 +1,14 @@
-import json
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from embedder import get_embeddings
+import prototypes
+from embedder import get_embeddings, normalize
 
-with open("data/sections.json") as f:
-    SECTION_EXAMPLES = json.load(f)
-
-section_labels = list(SECTION_EXAMPLES.keys())
-section_texts = [" ".join(v) for v in SECTION_EXAMPLES.values()]
-section_embeddings = get_embeddings(section_texts)
+def classify_embeddings(sent_embeddings, p=None):
+    # p: the caller's prototype set, so one request never mixes two across a reload
+    if not len(sent_embeddings):
+        return []
+    p = p or prototypes.current()
+    sims = normalize(sent_embeddings) @ p["section_embeddings"].T
+    return [p["section_labels"][i] for i in np.argmax(sims, axis=1)]
 
 def classify_sentence(sentence):
-    emb = get_embeddings([sentence])[0]
-    sims = cosine_similarity([emb], section_embeddings)[0]
-    return section_labels[int(np.argmax(sims))]
+    return classify_embeddings(get_embeddings([sentence]))[0]
@@ -0,0 +1,49 @@
+import io
+import re
+
+PDF_TYPES = {"application/pdf"}
+DOCX_TYPES = {"application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
+
+# Same length window as the backend's chunkResumeText
+MIN_CHARS, MAX_CHARS = 20, 300
+# Line breaks, bullet glyphs, sentence ends and spaced dashes; unlike the backend's split on
+# every "." and "-", this keeps "Node.js", "B.Tech" and "full-stack" intact
+_BREAK_RE = re.compile(r"\n+|[•▪●◦■►✓➢]|(?<=[.!?;])\s+|\s+[-–—|]\s+|^\s*[-*]\s+", re.M)
+
+
+class UnsupportedDocument(ValueError):
+    pass
+
+
+def chunk_resume_text(text):
+    chunks = (c.strip(" \t\r.-*") for c in _BREAK_RE.split(text))
+    return [" ".join(c.split()) for c in chunks if MIN_CHARS < len(c) < MAX_CHARS]
+
+
+def _pdf_text(data):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise UnsupportedDocument("PDF ingestion needs the pypdf package")
+    return "\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+
+
+def _docx_text(data):
+    try:
+        import docx
+    except ImportError:
+        raise UnsupportedDocument("DOCX ingestion needs the python-docx package")
+    return "\n".join(p.text for p in docx.Document(io.BytesIO(data)).paragraphs)
+
+
+def extract_text(data, content_type=None):
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    # Uploads often arrive as application/octet-stream, so fall back to magic bytes
+    if content_type in PDF_TYPES or data[:5] == b"%PDF-":
+        return _pdf_text(data)
+    if content_type in DOCX_TYPES or data[:2] == b"PK":
+        return _docx_text(data)
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        raise UnsupportedDocument(f"Unsupported resume body ({content_type or 'unknown type'})")
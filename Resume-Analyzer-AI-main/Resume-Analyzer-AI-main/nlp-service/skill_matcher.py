@@ -1,32 +1,28 @@
-import json
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from embedder import get_embeddings
-
-with open("data/skills.json") as f:
-    SKILL_PROTOTYPES = json.load(f)
-
-skill_names = list(SKILL_PROTOTYPES.keys())
-skill_texts = [ex for v in SKILL_PROTOTYPES.values() for ex in v]
-
-skill_map = []
-for skill, examples in SKILL_PROTOTYPES.items():
-    for _ in examples:
-        skill_map.append(skill)
-
-skill_embeddings = get_embeddings(skill_texts)
+import prototypes
+from embedder import get_embeddings, normalize
+from prototype_index import max_per_label
+
+def match_skills(sent_embeddings, threshold=0.55, k=None, p=None):
+    if not len(sent_embeddings):
+        return {}
+    p = p or prototypes.current()
+    # Nearest prototypes per sentence, then the best one per skill
+    scores, ids = p["skill_index"].search(normalize(sent_embeddings), k)
+    per_skill = max_per_label(scores, ids, p["skill_labels"], len(p["skill_names"]), threshold)
+    return {p["skill_names"][i]: float(per_skill[i]) for i in np.flatnonzero(per_skill >= threshold)}
+
+def match_skills_per_sentence(sent_embeddings, threshold=0.55, k=None, p=None):
+    if not len(sent_embeddings):
+        return []
+    p = p or prototypes.current()
+    # One search for the batch, reduced row by row
+    scores, ids = p["skill_index"].search(normalize(sent_embeddings), k)
+    results = []
+    for row_scores, row_ids in zip(scores, ids):
+        per_skill = max_per_label(row_scores, row_ids, p["skill_labels"], len(p["skill_names"]), threshold)
+        results.append({p["skill_names"][i]: float(per_skill[i]) for i in np.flatnonzero(per_skill >= threshold)})
+    return results
 
 def extract_skills(resume_sentences, threshold=0.55):
-    found = {}
-
-    sent_embeddings = get_embeddings(resume_sentences)
-
-    for sent_emb in sent_embeddings:
-        sims = cosine_similarity([sent_emb], skill_embeddings)[0]
-
-        for idx, score in enumerate(sims):
-            if score >= threshold:
-                skill = skill_map[idx]
-                found[skill] = max(found.get(skill, 0), float(score))
-
-    return found
+    return match_skills(get_embeddings(resume_sentences), threshold)
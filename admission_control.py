@@ -0,0 +1,113 @@
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; reason is "queue_full", "queue_timeout" or "rate_limited"."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Admission:
+    """A held slot; release() is idempotent so both a stream's finally and its cleanup task may call it."""
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+
+class AdmissionController:
+    """Caps concurrent LLM-bound requests per worker, with a bounded FIFO wait queue and a wait deadline.
+
+    Requests beyond max_concurrent wait up to queue_timeout seconds for a slot; once max_queue
+    requests are already waiting, new ones are shed immediately instead of piling up.
+    """
+
+    def __init__(self, max_concurrent: int = 32, max_queue: int = 64, queue_timeout: float = 5.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_queue_timeout": 0,
+                         "rate_limited": 0, "degraded": 0, "rejected": 0}
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self) -> Admission:
+        if self._slots.locked():
+            if self.waiting >= self.max_queue:
+                self.counters["shed_queue_full"] += 1
+                raise Overloaded("queue_full", retry_after=self.queue_timeout)
+            self.waiting += 1
+            self.counters["queued"] += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.counters["shed_queue_timeout"] += 1
+                raise Overloaded("queue_timeout", retry_after=self.queue_timeout)
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        self.counters["admitted"] += 1
+        return Admission(self)
+
+    def _release(self):
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return dict(self.counters, in_flight=self.in_flight, waiting=self.waiting,
+                    max_concurrent=self.max_concurrent, max_queue=self.max_queue)
+
+
+class RateLimiter:
+    """Per-client token buckets: `rate` tokens per second up to `burst`, for at most max_clients clients.
+
+    A request costing more than `burst` is admitted on a full bucket and leaves it in debt,
+    so large batches are still charged in full before the client's next request.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()   # key -> (tokens, last refill)
+        self._lock = threading.Lock()
+
+    def allow(self, key: str | None, cost: float = 1.0) -> bool:
+        if not key or self.rate <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            allowed = tokens >= min(cost, self.burst)
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_clients:
+                # Least recently seen clients are dropped (they come back with a full bucket)
+                self._buckets.popitem(last=False)
+        return allowed
+
+    def retry_after(self, key: str | None, cost: float = 1.0) -> float:
+        """Seconds until `key` can afford `cost` again."""
+        if not key or self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        return max(0.0, min(cost, self.burst) - tokens) / self.rate
@@ -0,0 +1,206 @@
+import re
+import time
+import json
+import zlib
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EMBED_DIMS = 256
+_WORD_RE = re.compile(r"[a-z0-9+#]+")
+
+
+def embed_query(text: str) -> np.ndarray:
+    """Cheap local embedding: hashed word and character-trigram counts, L2-normalized."""
+    vec = np.zeros(EMBED_DIMS, dtype=np.float32)
+    words = _WORD_RE.findall(text.lower())
+    for w in words:
+        vec[zlib.crc32(w.encode()) % EMBED_DIMS] += 2.0
+    joined = f" {' '.join(words)} "
+    for i in range(len(joined) - 2):
+        vec[zlib.crc32(joined[i:i + 3].encode()) % EMBED_DIMS] += 1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+
+class InProcessBackend:
+    """Redis-style hashes (hget/hset/hgetall/hdel/hlen) with per-key TTL, LRU-evicted by key.
+
+    max_entries bounds the number of fields across all keys; the least recently used
+    keys are dropped whole to stay under it.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self.size = 0
+        self._data = OrderedDict()  # key -> [expires_at, {field: value}]
+        self._lock = threading.Lock()
+
+    def _alive(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] is not None and item[0] <= now:
+            self._drop(key)
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def _drop(self, key):
+        self.size -= len(self._data.pop(key)[1])
+
+    def hget(self, key, field):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            return item[1].get(field) if item else None
+
+    def hgetall(self, key) -> dict:
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            return dict(item[1]) if item else {}
+
+    def hlen(self, key) -> int:
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            return len(item[1]) if item else 0
+
+    def hset(self, key, field, value):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            if item is None:
+                item = self._data[key] = [None, {}]
+            self.size += field not in item[1]
+            item[1][field] = value
+            while self.size > self.max_entries and len(self._data) > 1:
+                self._drop(next(iter(self._data)))
+                self.evictions += 1
+        return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            if item is None:
+                return 0
+            removed = sum(1 for f in fields if item[1].pop(f, None) is not None)
+            self.size -= removed
+            return removed
+
+    def expire(self, key, seconds):
+        with self._lock:
+            item = self._alive(key, time.monotonic())
+            if item is not None:
+                item[0] = time.monotonic() + seconds
+            return item is not None
+
+
+def make_backend(url: str | None = None, max_entries: int = 2048):
+    """In-process LRU by default; any Redis-protocol server (Redis, Valkey, a local stand-in) when a URL is given."""
+    if not url:
+        return InProcessBackend(max_entries)
+    import redis  # optional dependency, only needed for a shared cache
+    return redis.Redis.from_url(url)
+
+
+class AnswerCache:
+    """Caches generated replies per (primary_name, normalized intent, latest iso_week, question wording).
+
+    Near-duplicate phrasings are only matched among replies for the same intent, so a reworded
+    question is never answered with a reply built from a different slice of the data.
+    """
+
+    def __init__(self, backend, watermark_fn, ttl: int = 6 * 3600, similarity: float = 0.9,
+                 watermark_ttl: float = 60.0, prefix: str = "answer", max_per_namespace: int = 64):
+        self.backend = backend
+        self.max_per_namespace = max_per_namespace
+        self.watermark_fn = watermark_fn
+        self.ttl = ttl
+        self.similarity = similarity
+        self.watermark_ttl = watermark_ttl
+        self.prefix = prefix
+        self._watermark = (None, 0.0)
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "errors": 0}
+
+    def latest_week(self):
+        """Latest iso_week in tech_metrics, re-read at most every watermark_ttl seconds."""
+        week, fetched_at = self._watermark
+        if week is None or time.monotonic() - fetched_at > self.watermark_ttl:
+            week = self.watermark_fn()
+            self._watermark = (week, time.monotonic())
+        return week
+
+    @staticmethod
+    def intent_key(intent) -> str:
+        return hashlib.sha1(repr(intent).encode()).hexdigest()[:16]
+
+    @staticmethod
+    def query_key(user_query: str) -> str:
+        return hashlib.sha1(" ".join(_WORD_RE.findall(user_query.lower())).encode()).hexdigest()[:16]
+
+    def _namespace(self, primary_name: str, intent, week) -> str:
+        # A new week of data changes the namespace, so stale answers are never read again
+        topic = hashlib.sha1(primary_name.encode()).hexdigest()[:12]
+        return f"{self.prefix}:{week}:{topic}:{self.intent_key(intent)}"
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def lookup(self, primary_name: str, intent, user_query: str):
+        """Returns (reply, "exact" | "semantic") on a hit, or (None, None)."""
+        try:
+            # Each namespace is one hash of question wording -> entry, so a miss reads only the
+            # replies for this topic, intent and week (never a keyspace scan)
+            ns = self._namespace(primary_name, intent, self.latest_week())
+            raw = self.backend.hget(ns, self.query_key(user_query))
+            if raw is not None:
+                self._count("exact_hits")
+                return json.loads(raw)["reply"], "exact"
+
+            # Near-duplicate phrasing of an already answered question with the same intent
+            query_vec = embed_query(user_query)
+            best, best_sim = None, self.similarity
+            for raw in self.backend.hgetall(ns).values():
+                entry = json.loads(raw)
+                sim = float(np.dot(query_vec, np.asarray(entry["vector"], dtype=np.float32)))
+                if sim >= best_sim:
+                    best, best_sim = entry, sim
+            if best is not None:
+                self._count("semantic_hits")
+                return best["reply"], "semantic"
+        except Exception as e:
+            print(f"    [!] Answer cache lookup failed: {e}")
+            self._count("errors")
+        self._count("misses")
+        return None, None
+
+    def store(self, primary_name: str, intent, user_query: str, reply: str):
+        try:
+            ns = self._namespace(primary_name, intent, self.latest_week())
+            entry = {"reply": reply, "query": user_query, "vector": embed_query(user_query).round(4).tolist(),
+                     "stored": time.time()}
+            self.backend.hset(ns, self.query_key(user_query), json.dumps(entry))
+            # The namespace expires as a whole, ttl after its latest store
+            self.backend.expire(ns, self.ttl)
+            if self.backend.hlen(ns) > self.max_per_namespace:
+                entries = self.backend.hgetall(ns)
+                oldest = sorted(entries, key=lambda f: json.loads(entries[f]).get("stored", 0))
+                self.backend.hdel(ns, *oldest[:len(entries) - self.max_per_namespace])
+            self._count("stores")
+        except Exception as e:
+            print(f"    [!] Answer cache store failed: {e}")
+            self._count("errors")
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.counters)
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["exact_hits"] + stats["semantic_hits"]) / lookups, 4) if lookups else 0.0
+        stats["backend"] = type(self.backend).__name__
+        if isinstance(self.backend, InProcessBackend):
+            stats["entries"] = self.backend.size
+            stats["evictions"] = self.backend.evictions
+        return stats
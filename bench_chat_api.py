@@ -0,0 +1,332 @@
+"""
+Offline replay benchmark for chat_api: no Gemini, no Supabase, no network.
+
+Run:  python bench_chat_api.py --levels 1,10,50 --requests 200 --llm-latency 0.3 --output bench.json
+
+Gemini is replaced by a deterministic stub whose latency is `--llm-latency` plus
+`--llm-per-token` per generated token, and tech_metrics by an in-memory store seeded
+from master_tech_data.json. Queries are replayed in-process through the ASGI app at
+each concurrency level; the report holds throughput, end-to-end latency percentiles
+and the per-stage percentiles recorded by pipeline_tracing, as JSON for diffing
+across changes.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("TRACE_LOG", "0")
+
+import httpx
+
+import chat_api
+import load_test_chat
+import pipeline_tracing
+import rag_pipeline
+from answer_cache import AnswerCache, make_backend
+from metrics_snapshot import MetricsSnapshot
+from query_planner import METRICS
+
+QUERY_TEMPLATES = [
+    "How is {name} trending?",
+    "Show me GitHub activity for {name} over the last 3 months",
+    "What are the latest job numbers for {name}?",
+    "What was the average news coverage of {name} in the past 6 months?",
+    "Is {synonym} hiring growing?",
+    "Compare {name} vs {other}",
+]
+GENERAL_QUERIES = [
+    "What is the meaning of life?",
+    "Which of the new chips is best?",
+    "Tell me something interesting about technology",
+]
+
+
+# ── Stub Gemini ───────────────────────────────────────────────────────────
+
+class StubUsage:
+    def __init__(self, prompt: str, text: str):
+        self.prompt_token_count = max(1, len(prompt) // 4)
+        self.candidates_token_count = max(1, len(text) // 4)
+
+
+class StubResponse:
+    def __init__(self, text: str, usage: StubUsage | None = None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class StubModels:
+    """Answers entity/planning prompts with the first shortlisted candidate and everything else with canned prose."""
+
+    def __init__(self, latency: float, per_token: float, answer_tokens: int):
+        self.latency = latency
+        self.per_token = per_token
+        self.answer = " ".join(["insight"] * answer_tokens)
+
+    def _reply(self, prompt: str) -> str:
+        m = re.search(r"(?:catalog of valid technologies|Valid technologies \(JSON\)): (\[.*?\])\n", prompt, re.S)
+        if not m:
+            return self.answer
+        candidates = json.loads(m.group(1))
+        top = candidates[0] if candidates else {}
+        reply = {"primary_name": top.get("primary_name"), "category_name": top.get("category")}
+        if "Database schema" in prompt and top:
+            # Fused planning mode also expects a declarative query spec
+            reply["query"] = {
+                "table": "tech_metrics", "select": list(METRICS), "order": "iso_week", "desc": True, "limit": 12,
+                "filters": [{"op": "eq", "column": "topic_name", "value": top["primary_name"]}],
+            }
+        if "User Queries (numbered)" in prompt:
+            # Batched extraction: one object per numbered query
+            return json.dumps([dict(reply, index=int(i)) for i in re.findall(r"^\s*(\d+)\. \"", prompt, re.M)])
+        return json.dumps(reply)
+
+    async def generate_content(self, model=None, contents="", config=None):
+        text = self._reply(contents)
+        await asyncio.sleep(self.latency + self.per_token * len(text.split()))
+        return StubResponse(text, StubUsage(contents, text))
+
+    async def get(self, model=None):
+        return {"name": model}
+
+    async def generate_content_stream(self, model=None, contents="", config=None):
+        text = self._reply(contents)
+        await asyncio.sleep(self.latency)
+
+        async def chunks():
+            words = text.split()
+            for i in range(0, len(words), 8):
+                await asyncio.sleep(self.per_token * len(words[i:i + 8]))
+                yield StubResponse(" ".join(words[i:i + 8]) + " ")
+            yield StubResponse("", StubUsage(contents, text))
+        return chunks()
+
+
+class StubGemini:
+    def __init__(self, models: StubModels):
+        self.models = self  # sync calls are not used by chat_api
+        self.aio = type("StubAio", (), {"models": models})()
+
+
+# ── Fake Supabase ─────────────────────────────────────────────────────────
+
+class FakeResult:
+    def __init__(self, data: list):
+        self.data = data
+
+
+class FakeQuery:
+    """The subset of the supabase-py builder that query_planner and metrics_snapshot use."""
+
+    def __init__(self, store, table: str):
+        self.store = store
+        self.table = table
+        self.rows = store.tables.get(table, [])
+        self.columns = None
+        self.inserted = None
+
+    def select(self, columns: str):
+        self.columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def _filter(self, pred):
+        self.rows = [r for r in self.rows if pred(r)]
+        return self
+
+    def eq(self, c, v): return self._filter(lambda r: r.get(c) == v)
+    def neq(self, c, v): return self._filter(lambda r: r.get(c) != v)
+    def gt(self, c, v): return self._filter(lambda r: r.get(c) > v)
+    def gte(self, c, v): return self._filter(lambda r: r.get(c) >= v)
+    def lt(self, c, v): return self._filter(lambda r: r.get(c) < v)
+    def lte(self, c, v): return self._filter(lambda r: r.get(c) <= v)
+    def in_(self, c, v): return self._filter(lambda r: r.get(c) in set(v))
+
+    def order(self, column: str, desc: bool = False):
+        self.rows = sorted(self.rows, key=lambda r: r[column], reverse=desc)
+        return self
+
+    def limit(self, n: int):
+        self.rows = self.rows[:n]
+        return self
+
+    def range(self, start: int, end: int):
+        self.rows = self.rows[start:end + 1]
+        return self
+
+    def insert(self, rows):
+        self.inserted = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def execute(self):
+        time.sleep(self.store.latency)
+        if self.inserted is not None:
+            self.store.tables.setdefault(self.table, []).extend(self.inserted)
+            return FakeResult(self.inserted)
+        if self.columns:
+            return FakeResult([{k: r[k] for k in self.columns if k in r} for r in self.rows])
+        return FakeResult([dict(r) for r in self.rows])
+
+
+class FakeSupabase:
+    """tech_metrics seeded with a deterministic random walk per catalog topic."""
+
+    def __init__(self, catalog: list, weeks: int, latency: float, seed: int = 7):
+        self.latency = latency
+        rng = random.Random(seed)
+        # Fixed anchor so reports from different days replay identical data
+        end = datetime.date(2025, 12, 29)
+        week_labels = []
+        for i in range(weeks, 0, -1):
+            year, week, _ = (end - datetime.timedelta(weeks=i - 1)).isocalendar()
+            week_labels.append(f"{year}-W{week:02d}")
+        rows = []
+        for topic in catalog:
+            level = {m: rng.uniform(5, 500) for m in METRICS}
+            for label in week_labels:
+                row = {"topic_name": topic["primary_name"], "iso_week": label}
+                for m in METRICS:
+                    level[m] = max(0.0, level[m] * rng.uniform(0.9, 1.12))
+                    row[m] = round(level[m], 2) if m == "trends" else int(level[m])
+                rows.append(row)
+        self.tables = {"tech_metrics": rows, "chat_history": []}
+
+    def table(self, name: str):
+        return FakeQuery(self, name)
+
+
+# ── Harness ───────────────────────────────────────────────────────────────
+
+def build_corpus(catalog: list, size: int, seed: int) -> list:
+    rng = random.Random(seed)
+    queries = []
+    while len(queries) < size:
+        if rng.random() < 0.1:
+            queries.append(rng.choice(GENERAL_QUERIES))
+            continue
+        topic, other = rng.sample(catalog, 2)
+        synonyms = topic.get("synonyms") or [topic["primary_name"]]
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            name=topic["primary_name"], other=other["primary_name"], synonym=rng.choice(synonyms)))
+    return queries
+
+
+def load_corpus(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    # Either plain text, one query per line, or JSONL with a "message" field
+    return [json.loads(line)["message"] if line.startswith("{") else line for line in lines]
+
+
+def reset_state(use_cache: bool, use_snapshot: bool):
+    """Fresh cache, warm snapshot and empty metrics so every level starts from the same place."""
+    rag_pipeline.SNAPSHOT_ENABLED = use_snapshot
+    rag_pipeline.metrics_snapshot = MetricsSnapshot(None)
+    if use_snapshot:
+        rag_pipeline.metrics_snapshot.refresh(rag_pipeline.get_supabase())
+    cache = AnswerCache(make_backend(None, 2048), rag_pipeline.latest_iso_week, ttl=21600, similarity=0.9)
+    if not use_cache:
+        cache.lookup = lambda *args: (None, None)
+        cache.store = lambda *args: None
+    rag_pipeline.answer_cache = cache
+    # Every replayed request shares one user_id; per-client limits would measure the limiter, not the pipeline
+    chat_api.rate_limiter.rate = chat_api.address_limiter.rate = 0
+    pipeline_tracing.metrics.reset()
+
+
+async def run_level(client, path, concurrency, total, queries):
+    result = await load_test_chat.run_level(
+        client, path, concurrency, total, queries,
+        extra={"user_id": "bench"}, error_markers=("I encountered an error", "event: error"))
+    return {
+        "concurrency": concurrency,
+        "completed": result["completed"],
+        "errors": result["errors"],
+        "elapsed_s": result["elapsed_s"],
+        "throughput": result["throughput"],
+        "latency_s": {f"p{p}": result[f"p{p}"] for p in (50, 95, 99)},
+        "stages": pipeline_tracing.metrics.snapshot(),
+        "answer_cache": rag_pipeline.answer_cache.stats(),
+    }
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Offline chat_api benchmark with stub Gemini and fake Supabase")
+    parser.add_argument("--levels", default="1,10,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per level")
+    parser.add_argument("--endpoint", choices=("chat", "stream"), default="chat")
+    parser.add_argument("--queries", help="Query corpus file (one per line, or JSONL with 'message')")
+    parser.add_argument("--corpus-size", type=int, default=200, help="Generated corpus size when --queries is absent")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Stub Gemini base latency (s)")
+    parser.add_argument("--llm-per-token", type=float, default=0.002, help="Stub Gemini latency per output token (s)")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--db-latency", type=float, default=0.04, help="Fake Supabase latency per call (s)")
+    parser.add_argument("--weeks", type=int, default=52, help="Weeks of tech_metrics per topic")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the answer cache")
+    parser.add_argument("--no-snapshot", action="store_true", help="Query the fake store instead of the snapshot")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    catalog = rag_pipeline.get_catalog()["catalog"]
+    rag_pipeline.configure(
+        client=StubGemini(StubModels(args.llm_latency, args.llm_per_token, args.answer_tokens)),
+        supabase=FakeSupabase(catalog, args.weeks, args.db_latency, args.seed),
+    )
+    queries = load_corpus(args.queries) if args.queries else build_corpus(catalog, args.corpus_size, args.seed)
+    path = "/chat" if args.endpoint == "chat" else "/chat/stream"
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+
+    results = []
+    transport = httpx.ASGITransport(app=chat_api.app)
+    chat_api.history_writer.spill_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "chat_history_spill.jsonl")
+    chat_api.history_writer.start()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            for level in levels:
+                reset_state(not args.no_cache, not args.no_snapshot)
+                # Pipeline progress lines would swamp the report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    result = await run_level(client, path, level, args.requests, queries)
+                results.append(result)
+                print(f"conc {level:>4}: {result['throughput']:8.2f} req/s  p50 {result['latency_s']['p50']:.3f}s  "
+                      f"p95 {result['latency_s']['p95']:.3f}s  errors {result['errors']}", file=sys.stderr)
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            chat_api.history_writer.stop()
+
+    report = {
+        "benchmark": "chat_api_offline",
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "corpus_size": len(queries),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
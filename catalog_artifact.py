@@ -0,0 +1,86 @@
+"""
+Precompiled tech catalog: the trimmed catalog plus its EntityResolver index in one pickle.
+
+Build ahead of deploys with  python catalog_artifact.py  (otherwise it is built on first load).
+The artifact records hashes of master_tech_data.json and of entity_resolver.py, and is rebuilt
+whenever either changes (the pickled index is only valid for the resolver code that built it).
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import sys
+
+import entity_resolver
+from entity_resolver import EntityResolver
+
+ARTIFACT_VERSION = 1
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SOURCE = os.path.join(BASE_DIR, "master_tech_data.json")
+DEFAULT_ARTIFACT = os.path.join(BASE_DIR, ".cache", "tech_catalog.pickle")
+
+
+def _resolver_sha1() -> str:
+    with open(entity_resolver.__file__, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+RESOLVER_SHA1 = _resolver_sha1()
+
+
+def build_catalog(raw: bytes) -> dict:
+    master_data = json.loads(raw)
+    # Only what entity resolution and the LLM prompts need
+    catalog = [{"primary_name": t.get("primary_name"), "category": t.get("category"), "synonyms": t.get("synonyms", [])} for t in master_data]
+    return {
+        "version": ARTIFACT_VERSION,
+        "source_sha1": hashlib.sha1(raw).hexdigest(),
+        "resolver_sha1": RESOLVER_SHA1,
+        "catalog": catalog,
+        "topics": frozenset(t["primary_name"] for t in catalog if t["primary_name"]),
+        "resolver": EntityResolver(catalog),
+    }
+
+
+def save_artifact(artifact: dict, path: str):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+    # Workers starting together never read a half-written file
+    os.replace(tmp, path)
+
+
+def load_catalog(source_path: str = DEFAULT_SOURCE, artifact_path: str | None = DEFAULT_ARTIFACT) -> dict:
+    """Returns {"catalog", "topics", "resolver", ...}, from the artifact when it matches the source."""
+    with open(source_path, "rb") as f:
+        raw = f.read()
+    digest = hashlib.sha1(raw).hexdigest()
+
+    if artifact_path and os.path.exists(artifact_path):
+        try:
+            with open(artifact_path, "rb") as f:
+                artifact = pickle.load(f)
+            if (artifact.get("version") == ARTIFACT_VERSION and artifact.get("source_sha1") == digest
+                    and artifact.get("resolver_sha1") == RESOLVER_SHA1):
+                return artifact
+        except Exception as e:
+            print(f"    [!] Rebuilding unreadable catalog artifact {artifact_path}: {e}")
+
+    artifact = build_catalog(raw)
+    if artifact_path:
+        try:
+            save_artifact(artifact, artifact_path)
+        except OSError as e:
+            print(f"    [!] Could not write catalog artifact {artifact_path}: {e}")
+    return artifact
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SOURCE
+    target = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_ARTIFACT
+    with open(source, "rb") as f:
+        artifact = build_catalog(f.read())
+    save_artifact(artifact, target)
+    print(f"Wrote {len(artifact['catalog'])} topics, {len(artifact['resolver'].aliases)} aliases to {target}")
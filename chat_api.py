@@ -1,62 +1,489 @@
-from fastapi import FastAPI, HTTPException
+import math
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Header, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel
 import rag_pipeline
 import traceback
+import json
+import os
+from history_writer import HistoryWriter
+from session_store import SessionStore
+from admission_control import AdmissionController, Overloaded, RateLimiter
+import pipeline_tracing
+from pipeline_tracing import span
 
-app = FastAPI()
+def _insert_history(rows: list):
+    with span("history", rows=len(rows), payload_bytes=len(json.dumps(rows, default=str))):
+        rag_pipeline.get_supabase().table('chat_history').insert(rows).execute()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow React frontend
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+# chat_history rows are written behind the response in coalesced bulk inserts
+history_writer = HistoryWriter(
+    _insert_history,
+    os.getenv("HISTORY_SPILL_PATH", os.path.join(rag_pipeline.CACHE_DIR, "chat_history_spill.jsonl")),
+    max_queue=int(os.getenv("HISTORY_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("HISTORY_BATCH_SIZE", "50")),
+    flush_interval=float(os.getenv("HISTORY_FLUSH_SECONDS", "2")),
 )
 
+def _collect_component_metrics():
+    # Cache and history counters are scraped alongside the stage latencies
+    cache = rag_pipeline.answer_cache.stats()
+    history = history_writer.stats()
+    return [
+        ("chat_answer_cache", "gauge", "Answer cache counters.",
+         [({"stat": k}, v) for k, v in cache.items() if isinstance(v, (int, float))]),
+        ("chat_history_writer", "gauge", "chat_history write-behind counters.",
+         [({"stat": k}, v) for k, v in history.items()]),
+        ("chat_sessions", "gauge", "Conversation session counters.",
+         [({"stat": k}, v) for k, v in sessions.stats().items()]),
+        ("chat_admission", "gauge", "Admission control: in-flight and queued requests, admitted/shed/degraded counts.",
+         [({"stat": k}, v) for k, v in admission.stats().items()]),
+        ("chat_snapshot_loaded", "gauge", "Whether the tech_metrics snapshot is loaded.",
+         [({}, int(rag_pipeline.metrics_snapshot.loaded))]),
+    ]
+
+pipeline_tracing.metrics.register_collector(_collect_component_metrics)
+
+# Per-session conversation state so follow-ups can reuse the previous turn's dataset
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX", "5000")),
+    ttl=float(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    max_rows=int(os.getenv("SESSION_MAX_ROWS", "1000")),
+)
+
+# Per-worker cap on LLM-bound requests; beyond it requests wait briefly, then are shed
+admission = AdmissionController(
+    max_concurrent=int(os.getenv("CHAT_MAX_CONCURRENCY", "32")),
+    max_queue=int(os.getenv("CHAT_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("CHAT_QUEUE_TIMEOUT", "5")),
+)
+# Per-client LLM budget: RATE_LIMIT_PER_MINUTE sustained, RATE_LIMIT_BURST at once (0 disables)
+rate_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_PER_MINUTE", "20")) / 60,
+    burst=float(os.getenv("RATE_LIMIT_BURST", "10")),
+)
+# user_id is not authenticated, so every request is also charged to its client address; the
+# address budget is larger so a few users behind one NAT are not throttled by each other
+address_limiter = RateLimiter(
+    rate=float(os.getenv("RATE_LIMIT_PER_ADDRESS_MINUTE", "60")) / 60,
+    burst=float(os.getenv("RATE_LIMIT_ADDRESS_BURST", "30")),
+)
+# Shed requests get a cached or data-only answer when possible instead of a bare 503
+DEGRADE_ON_OVERLOAD = os.getenv("DEGRADE_ON_OVERLOAD", "1") != "0"
+
+# Set once the catalog is loaded and Supabase/Gemini connections are open
+readiness = {"ready": False, "checks": {}}
+_warm_lock = asyncio.Lock()
+
+async def _warm_up() -> dict:
+    async with _warm_lock:
+        if not readiness["ready"]:
+            checks = await rag_pipeline.awarm_up()
+            readiness.update(ready=all(v == "ok" for v in checks.values()), checks=checks)
+            print(f"Warm-up: {checks}")
+    return readiness
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Replaying the spill file may hit the network, so keep it off the event loop
+    await rag_pipeline.run_blocking(history_writer.start)
+    # Warm in the background so the worker starts accepting connections immediately
+    warm_task = asyncio.create_task(_warm_up())
+    yield
+    warm_task.cancel()
+    await rag_pipeline.run_blocking(history_writer.stop)
+
+router = APIRouter()
+
 class ChatRequest(BaseModel):
     message: str
     user_id: str | None = None
+    session_id: str | None = None
+
+    @property
+    def session_key(self) -> str | None:
+        return self.session_id or self.user_id
+
+class BatchChatRequest(BaseModel):
+    messages: list[str]
+    user_id: str | None = None
+
+# Dashboards send one question per card; generations for a batch share this cap
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "25"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+def _store_history(user_id: str | None, user_query: str, reply: str):
+    # Store in database if a user_id is provided; the write happens off the request path
+    if user_id:
+        history_writer.enqueue({"user_id": user_id, "query": user_query, "reply": reply})
+
+def _follow_up_entities(state: dict | None, user_query: str) -> dict | None:
+    if not state:
+        return None
+    with span("session") as sp:
+        entities = sessions.follow_up_entities(state, user_query, rag_pipeline.entity_resolver.resolve(user_query))
+        sp.set(follow_up=entities is not None)
+    return entities
+
+async def _resolve(user_query: str, session_key: str | None = None) -> dict:
+    """Step 2, or the session's topic for a follow-up; _retrieve takes the result from there."""
+    state = sessions.get(session_key)
+    entities = _follow_up_entities(state, user_query) or await rag_pipeline.astep_2_identify_entities(user_query)
+    llm_plan = entities.pop("query_plan", None)
+    return {"entities": entities, "plan": None, "retrieved_data": None, "cached_reply": None,
+            "session": state, "llm_plan": llm_plan}
+
+async def _retrieve(ctx: dict, user_query: str, session_key: str | None = None) -> dict:
+    """Steps 3-4, short-circuiting on a session follow-up or an answer cache hit.
+
+    retrieved_data stays None when the answer must come from general knowledge.
+    """
+    entities, state = ctx["entities"], ctx["session"]
+    primary_name = entities.get("primary_name")
+    if not primary_name:
+        return ctx
+
+    print(f"Identified entity: {primary_name} ({entities.get('category_name')}) via {entities.get('resolved_by')}")
+    plan = rag_pipeline.step_3_plan_query(primary_name, user_query, ctx["llm_plan"])
+    ctx["plan"] = plan
+
+    if entities.get("resolved_by") == "session":
+        # Same topic as the previous turn: answer from its dataset when it covers this plan
+        rows = sessions.reuse(state, plan)
+        if rows is not None:
+            print(f"Reusing previous turn's data ({len(rows)} records)")
+            ctx["retrieved_data"] = rows
+            return ctx
+
+    with span("cache_lookup") as sp:
+        cached_reply, hit = await rag_pipeline.run_blocking(rag_pipeline.answer_cache.lookup, primary_name, plan, user_query)
+        sp.set(hit=hit or "miss")
+    if cached_reply is not None:
+        print(f"Answer cache hit ({hit})")
+        ctx["cached_reply"] = cached_reply
+        sessions.remember(session_key, entities)
+        return ctx
+
+    retrieved_data = await rag_pipeline.astep_4_execute_query(plan)
+    if retrieved_data and not (isinstance(retrieved_data, dict) and "error" in retrieved_data):
+        ctx["retrieved_data"] = retrieved_data
+        sessions.remember(session_key, entities, plan, retrieved_data)
+    else:
+        sessions.remember(session_key, entities)
+    return ctx
+
+async def _resolve_and_retrieve(user_query: str, session_key: str | None = None) -> dict:
+    """Runs steps 2-4; see _resolve and _retrieve."""
+    return await _retrieve(await _resolve(user_query, session_key), user_query, session_key)
+
+def _client_keys(user_id: str | None, request: Request) -> list:
+    """(limiter, key) pairs a request is charged to: its address, and its user (or address)."""
+    address = request.client.host if request.client else None
+    # Not the session id: clients pick a fresh one per conversation, which would reset their budget
+    return [(address_limiter, address), (rate_limiter, user_id or address)]
+
+async def _admit(client_keys: list, cost: float = 1.0):
+    """Charges the client's token buckets, then waits for a slot; raises Overloaded to shed."""
+    if not all(limiter.allow(key, cost) for limiter, key in client_keys):
+        admission.counters["rate_limited"] += 1
+        # Until every bucket the client draws on can pay again
+        retry_after = max(limiter.retry_after(key, cost) for limiter, key in client_keys)
+        raise Overloaded("rate_limited", retry_after=retry_after)
+    with span("admission") as sp:
+        sp.set(waiting=admission.waiting, in_flight=admission.in_flight)
+        return await admission.acquire()
+
+async def _degrade(user_query: str, overload: Overloaded) -> str | None:
+    """A cached or data-only reply for a shed request; None leaves only the error response."""
+    print(f"Shedding request ({overload.reason})")
+    if DEGRADE_ON_OVERLOAD:
+        try:
+            reply, _ = await rag_pipeline.adata_only_answer(user_query)
+        except Exception:
+            print(traceback.format_exc())
+            reply = None
+        if reply:
+            admission.counters["degraded"] += 1
+            return reply
+    admission.counters["rejected"] += 1
+    return None
+
+def _overloaded_response(overload: Overloaded, request_id: str) -> JSONResponse:
+    # 429 when this client is over its budget, 503 when the service as a whole is saturated
+    return JSONResponse(
+        status_code=429 if overload.reason == "rate_limited" else 503,
+        content={"reply": "The assistant is busy right now. Please try again in a moment.", "reason": overload.reason},
+        headers={"Retry-After": str(max(1, math.ceil(overload.retry_after))), "X-Request-ID": request_id},
+    )
+
+async def _cache_reply(ctx: dict, user_query: str, reply: str):
+    if ctx["retrieved_data"] is not None and reply:
+        await rag_pipeline.run_blocking(rag_pipeline.answer_cache.store, ctx["entities"]["primary_name"], ctx["plan"], user_query, reply)
+
+@router.post("/chat")
+async def chat_endpoint(req: ChatRequest, request: Request, response: Response, x_request_id: str | None = Header(default=None)):
+    request_id = response.headers["X-Request-ID"] = pipeline_tracing.new_request(x_request_id)
+    user_query = req.message
+    print(f"Received query: {user_query}")
+    try:
+        ticket = await _admit(_client_keys(req.user_id, request))
+    except Overloaded as overload:
+        reply = await _degrade(user_query, overload)
+        if reply is None:
+            return _overloaded_response(overload, request_id)
+        _store_history(req.user_id, user_query, reply)
+        return {"reply": reply, "degraded": True}
 
-@app.post("/chat")
-async def chat_endpoint(req: ChatRequest):
     try:
-        user_query = req.message
-        print(f"Received query: {user_query}")
-        
-        entities = rag_pipeline.step_2_identify_entities(user_query)
-        primary_name = entities.get("primary_name")
-        category_name = entities.get("category_name")
-        
-        if not primary_name:
-            reply = rag_pipeline.step_fallback_general_knowledge(user_query)
-        else:
-            print(f"Identified entity: {primary_name} ({category_name})")
-            
-            query_code = rag_pipeline.step_3_generate_supabase_query(primary_name, category_name, user_query)
-            retrieved_data = rag_pipeline.step_4_execute_query(query_code)
-            
-            if not retrieved_data or (isinstance(retrieved_data, dict) and "error" in retrieved_data):
-                reply = rag_pipeline.step_fallback_general_knowledge(user_query, primary_name)
+        with span("total", endpoint="/chat") as sp:
+            ctx = await _resolve_and_retrieve(user_query, req.session_key)
+            if ctx["cached_reply"] is not None:
+                reply = ctx["cached_reply"]
+            elif ctx["retrieved_data"] is None:
+                reply = await rag_pipeline.astep_fallback_general_knowledge(user_query, ctx["entities"].get("primary_name"))
             else:
-                reply = rag_pipeline.step_5_generate_human_response(user_query, retrieved_data)
+                reply = await rag_pipeline.astep_5_generate_human_response(user_query, ctx["retrieved_data"])
+                await _cache_reply(ctx, user_query, reply)
+            sp.set(reply_chars=len(reply or ""))
                 
-        # Store in database if a user_id is provided
-        if req.user_id:
-            try:
-                rag_pipeline.supabase.table('chat_history').insert({
-                    "user_id": req.user_id,
-                    "query": user_query,
-                    "reply": reply
-                }).execute()
-            except Exception as e:
-                print(f"Failed to store chat history: {e}")
-        
+        _store_history(req.user_id, user_query, reply)
         return {"reply": reply}
 
     except Exception as e:
         print(traceback.format_exc())
         return {"reply": "I encountered an error while processing your request. Please try again later."}
+    finally:
+        ticket.release()
+
+async def _answer_batch_item(item: dict, limiter: asyncio.Semaphore) -> str:
+    if item["cached_reply"] is not None:
+        return item["cached_reply"]
+    async with limiter:
+        if item["retrieved_data"] is None:
+            return await rag_pipeline.astep_fallback_general_knowledge(item["query"], item["entities"].get("primary_name"))
+        reply = await rag_pipeline.astep_5_generate_human_response(item["query"], item["retrieved_data"])
+    await _cache_reply(item, item["query"], reply)
+    return reply
+
+@router.post("/chat/batch")
+async def chat_batch_endpoint(req: BatchChatRequest, request: Request, response: Response, x_request_id: str | None = Header(default=None)):
+    """Answers several questions at once: entities and retrieval are resolved for the whole batch,
+    then generations run concurrently under BATCH_CONCURRENCY. Results keep request order."""
+    request_id = response.headers["X-Request-ID"] = pipeline_tracing.new_request(x_request_id)
+    if len(req.messages) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} messages per batch.")
+    print(f"Received batch of {len(req.messages)} queries")
+
+    try:
+        # The whole batch holds one slot (its generations have their own cap) but pays per message
+        ticket = await _admit(_client_keys(req.user_id, request), cost=len(req.messages))
+    except Overloaded as overload:
+        limiter = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+        async def degrade(q):
+            async with limiter:
+                return await _degrade(q, overload)
+
+        replies = await asyncio.gather(*(degrade(q) for q in req.messages))
+        if not any(replies):
+            return _overloaded_response(overload, request_id)
+        for q, r in zip(req.messages, replies):
+            if r:
+                _store_history(req.user_id, q, r)
+        return {"results": [{"reply": r, "primary_name": None, "cached": False, "degraded": True,
+                             "error": None if r else "The assistant is busy right now. Please try again in a moment."}
+                            for r in replies]}
+
+    try:
+        return await _run_batch(req)
+    finally:
+        ticket.release()
+
+async def _run_batch(req: BatchChatRequest) -> dict:
+    with span("total", endpoint="/chat/batch", items=len(req.messages)):
+        items = [{"query": q, "entities": {}, "plan": None, "retrieved_data": None, "cached_reply": None, "error": None}
+                 for q in req.messages]
+        for item, entities in zip(items, await rag_pipeline.astep_2_identify_entities_batch(req.messages)):
+            item["entities"] = entities
+            if entities.pop("error", None):
+                item["error"] = "I could not identify the technology in this question. Please try again later."
+            if entities.get("primary_name") and not item["error"]:
+                item["plan"] = rag_pipeline.step_3_plan_query(entities["primary_name"], item["query"])
+                item["cached_reply"], _ = await rag_pipeline.run_blocking(
+                    rag_pipeline.answer_cache.lookup, entities["primary_name"], item["plan"], item["query"])
+
+        to_fetch = [item for item in items if item["plan"] is not None and item["cached_reply"] is None]
+        if to_fetch:
+            try:
+                fetched = await rag_pipeline.astep_4_execute_batch([i["plan"] for i in to_fetch])
+            except Exception as e:
+                # e.g. the query stage timed out: fail these items, still answer the rest
+                print(f"    [!] Batch retrieval failed: {e!r}")
+                fetched = [None] * len(to_fetch)
+                for item in to_fetch:
+                    item["error"] = "I could not retrieve the data for this question. Please try again later."
+            for item, rows in zip(to_fetch, fetched):
+                if rows and not (isinstance(rows, dict) and "error" in rows):
+                    item["retrieved_data"] = rows
+
+        # Identical questions about the same data are generated once
+        limiter = asyncio.Semaphore(BATCH_CONCURRENCY)
+        shared = {}
+        for item in items:
+            if item["error"] is None:
+                key = (item["query"].strip().lower(), item["entities"].get("primary_name"), item["plan"])
+                if key not in shared:
+                    shared[key] = asyncio.ensure_future(_answer_batch_item(item, limiter))
+                item["task"] = shared[key]
+        await asyncio.gather(*shared.values(), return_exceptions=True)
+
+    results = []
+    for item in items:
+        task = item.get("task")
+        if task is not None and task.exception() is not None:
+            print(f"    [!] Batch item failed: {task.exception()!r}")
+            item["error"] = "I encountered an error while processing this question."
+        reply = None if item["error"] else task.result()
+        if reply is not None:
+            _store_history(req.user_id, item["query"], reply)
+        results.append({
+            "reply": reply,
+            "primary_name": item["entities"].get("primary_name"),
+            "cached": item["cached_reply"] is not None,
+            "error": item["error"],
+        })
+    return {"results": results}
+
+@router.get("/cache/stats")
+async def cache_stats_endpoint():
+    return rag_pipeline.answer_cache.stats()
+
+@router.get("/history/stats")
+async def history_stats_endpoint():
+    return history_writer.stats()
+
+@router.get("/sessions/stats")
+async def session_stats_endpoint():
+    return sessions.stats()
+
+@router.get("/ready")
+async def ready_endpoint(response: Response):
+    """Readiness probe: 200 once the catalog, Supabase and Gemini are warm, 503 until then."""
+    state = readiness if readiness["ready"] else await _warm_up()
+    if not state["ready"]:
+        response.status_code = 503
+    return state
+
+@router.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape target: per-stage latency quantiles, error and token counters."""
+    return PlainTextResponse(pipeline_tracing.metrics.render(), media_type="text/plain; version=0.0.4")
+
+async def _single(text: str):
+    yield text
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_stream_endpoint(req: ChatRequest, request: Request, x_request_id: str | None = Header(default=None)):
+    """Server-sent events: stage updates first, then answer tokens as Gemini produces them."""
+    user_query = req.message
+    print(f"Received streaming query: {user_query}")
+    request_id = pipeline_tracing.new_request(x_request_id)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Request-ID": request_id}
+
+    # Shedding happens before the stream opens, so clients get a real status code
+    try:
+        ticket = await _admit(_client_keys(req.user_id, request))
+    except Overloaded as overload:
+        reply = await _degrade(user_query, overload)
+        if reply is None:
+            return _overloaded_response(overload, request_id)
+        _store_history(req.user_id, user_query, reply)
+        # `overload` is unbound when the except block ends, before the stream body runs
+        reason = overload.reason
+
+        async def degraded_events():
+            yield _sse("stage", {"stage": "degraded", "reason": reason})
+            yield _sse("token", {"text": reply})
+            yield _sse("done", {"reply": reply, "degraded": True})
+        return StreamingResponse(degraded_events(), media_type="text/event-stream", headers=headers)
+
+    async def events():
+        try:
+            # The body is produced in its own task, so the request id is bound here
+            pipeline_tracing.new_request(request_id)
+            # Flush something immediately so time-to-first-byte does not wait on any stage
+            yield _sse("stage", {"stage": "received"})
+            parts = []
+            try:
+                with span("total", endpoint="/chat/stream") as sp:
+                    ctx = await _resolve(user_query, req.session_key)
+                    entities = ctx["entities"]
+                    # Sent before retrieval so the client can show the topic while data loads
+                    yield _sse("stage", {
+                        "stage": "entity_resolved",
+                        "primary_name": entities.get("primary_name"),
+                        "category_name": entities.get("category_name"),
+                        "resolved_by": entities.get("resolved_by"),
+                    })
+                    ctx = await _retrieve(ctx, user_query, req.session_key)
+                    retrieved_data = ctx["retrieved_data"]
+
+                    if ctx["cached_reply"] is not None:
+                        yield _sse("stage", {"stage": "cache_hit"})
+                        tokens = _single(ctx["cached_reply"])
+                    elif retrieved_data is None:
+                        tokens = rag_pipeline.astream_fallback_general_knowledge(user_query, entities.get("primary_name"))
+                    else:
+                        yield _sse("stage", {"stage": "data_retrieved", "records": len(retrieved_data)})
+                        tokens = rag_pipeline.astream_human_response(user_query, retrieved_data)
+
+                    async for text in tokens:
+                        parts.append(text)
+                        yield _sse("token", {"text": text})
+                    sp.set(reply_chars=sum(len(p) for p in parts))
+            except Exception:
+                print(traceback.format_exc())
+                yield _sse("error", {"message": "I encountered an error while processing your request. Please try again later."})
+                return
+
+            reply = "".join(parts)
+            yield _sse("done", {"reply": reply})
+            if ctx["cached_reply"] is None:
+                await _cache_reply(ctx, user_query, reply)
+            _store_history(req.user_id, user_query, reply)
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers=headers,
+        # Releases the slot even if the client disconnects before the body starts
+        background=BackgroundTask(ticket.release),
+    )
+
+def create_app() -> FastAPI:
+    """App factory; clients and the catalog are built lazily in each worker, not at import."""
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],  # Allow React frontend
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+# `uvicorn chat_api:app --workers N` or `uvicorn chat_api:create_app --factory --workers N`
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
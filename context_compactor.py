@@ -0,0 +1,147 @@
+import json
+
+import numpy as np
+
+from query_planner import METRICS
+
+DEFAULT_TOKEN_BUDGET = 600
+# (series points, include extremes' weeks and mean), from most to least detailed
+DETAIL_LEVELS = ((12, True), (6, True), (3, True), (0, True), (0, False))
+
+
+def estimate_tokens(payload) -> int:
+    """Rough token count for JSON sent to Gemini (~4 characters per token)."""
+    text = payload if isinstance(payload, str) else json.dumps(payload, default=str, separators=(",", ":"))
+    return max(1, len(text) // 4)
+
+
+def _downsample(weeks: list, values: np.ndarray, points: int) -> list:
+    # Evenly spaced samples that always keep the first and the latest week
+    if points <= 0:
+        return []
+    idx = np.unique(np.linspace(0, len(values) - 1, num=min(points, len(values))).round().astype(int))
+    return [[weeks[i], _num(values[i])] for i in idx if not np.isnan(values[i])]
+
+
+def _num(v):
+    v = float(v)
+    return int(v) if v.is_integer() else round(v, 2)
+
+
+def _summarize_metric(weeks: list, values: np.ndarray, points: int, detail: bool) -> dict | None:
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return None
+    last = int(np.flatnonzero(valid)[-1])
+    summary = {"latest": _num(values[last]), "latest_week": weeks[last]}
+
+    prev = np.flatnonzero(valid[:last])
+    if prev.size:
+        before = values[prev[-1]]
+        summary["wow_delta"] = _num(values[last] - before)
+        if before:
+            summary["wow_pct"] = round(float((values[last] - before) / abs(before) * 100), 1)
+
+    lo, hi = int(np.nanargmin(values)), int(np.nanargmax(values))
+    summary["min"], summary["max"] = _num(values[lo]), _num(values[hi])
+    if detail:
+        summary["min_week"], summary["max_week"] = weeks[lo], weeks[hi]
+        summary["mean"] = _num(np.nanmean(values))
+
+    if valid.sum() >= 2:
+        # Least-squares change per week over the window
+        x = np.flatnonzero(valid).astype(float)
+        summary["slope_per_week"] = round(float(np.polyfit(x, values[valid], 1)[0]), 3)
+    series = _downsample(weeks, values, points)
+    if series:
+        summary["series"] = series
+    return summary
+
+
+def _summarize(rows: list, points: int, detail: bool) -> dict:
+    by_topic, passthrough = {}, []
+    for row in rows:
+        if "iso_week" in row:
+            by_topic.setdefault(row.get("topic_name"), []).append(row)
+        else:
+            # Already-reduced rows (aggregate plans) are small enough to send as-is
+            passthrough.append(row)
+
+    topics = {}
+    for topic, topic_rows in by_topic.items():
+        topic_rows.sort(key=lambda r: r["iso_week"])
+        weeks = [r["iso_week"] for r in topic_rows]
+        out = {"weeks_covered": len(weeks), "from_week": weeks[0], "to_week": weeks[-1]}
+        for m in METRICS:
+            if not any(m in r for r in topic_rows):
+                continue
+            values = np.array([np.nan if r.get(m) is None else float(r[m]) for r in topic_rows])
+            summary = _summarize_metric(weeks, values, points, detail)
+            if summary:
+                out[m] = summary
+        topics[topic] = out
+
+    compact = {"topics": topics}
+    if passthrough:
+        compact["aggregates"] = passthrough
+    return compact
+
+
+def _fit(rows: list, token_budget: int) -> dict:
+    # Shed detail progressively: shorter series, then no series, then no extremes' weeks/means
+    for points, detail in DETAIL_LEVELS:
+        compact = _summarize(rows, points, detail)
+        if estimate_tokens(compact) <= token_budget:
+            break
+    return compact
+
+
+def compact_rows(rows, token_budget: int = DEFAULT_TOKEN_BUDGET):
+    """Summarizes raw tech_metrics rows to fit a token budget; returns (payload, size stats)."""
+    original_tokens = estimate_tokens(rows)
+    stats = {"rows": len(rows) if isinstance(rows, list) else 0, "original_tokens": original_tokens}
+    if not isinstance(rows, list) or not rows or original_tokens <= token_budget:
+        stats.update(compacted_tokens=original_tokens, compacted=False)
+        return rows, stats
+
+    compact = _fit(rows, token_budget)
+
+    # Last resort for many-topic payloads: keep as many whole topics as fit
+    if estimate_tokens(compact) > token_budget:
+        kept = {}
+        for topic, summary in compact["topics"].items():
+            if kept and estimate_tokens({"topics": {**kept, topic: summary}}) > token_budget:
+                break
+            kept[topic] = summary
+        compact["topics"] = kept
+        compact["truncated_topics"] = True
+
+    stats.update(compacted_tokens=estimate_tokens(compact), compacted=True)
+    return compact, stats
+
+
+METRIC_LABELS = {"jobs": "job postings", "github": "GitHub repositories", "trends": "search interest", "news": "news articles"}
+
+
+def _fmt(value) -> str:
+    return f"{value:,}" if isinstance(value, int) else f"{value:,.2f}"
+
+
+def describe_rows(rows: list) -> str:
+    """Plain-text summary of tech_metrics rows, for answers that cannot go through the LLM."""
+    compact = _summarize(rows, 0, False)
+    lines = []
+    for topic, summary in compact["topics"].items():
+        parts = []
+        for m in METRICS:
+            if m not in summary:
+                continue
+            s = summary[m]
+            change = f" ({s['wow_pct']:+.1f}% week over week)" if "wow_pct" in s else ""
+            parts.append(f"{METRIC_LABELS[m]} {_fmt(s['latest'])}{change}")
+        span_text = summary["to_week"] if summary["weeks_covered"] == 1 else f"{summary['from_week']} to {summary['to_week']}"
+        lines.append(f"- {topic} ({span_text}): " + ", ".join(parts))
+    for row in compact.get("aggregates", []):
+        values = ", ".join(f"{METRIC_LABELS[m]} {_fmt(_num(row[m]))}" for m in METRICS if m in row)
+        lines.append(f"- {row.get('topic_name')} ({row.get('aggregate')} over {row.get('from_week')} to {row.get('to_week')}): {values}")
+    return "\n".join(lines)
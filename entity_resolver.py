@@ -0,0 +1,200 @@
+import re
+import math
+import difflib
+from collections import defaultdict
+
+# Words that carry no information about *which* technology is being asked about
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "in", "on", "to", "with", "by", "at", "from", "vs", "versus",
+    "is", "are", "was", "were", "be", "been", "do", "does", "did", "how", "what", "whats", "which", "who",
+    "why", "when", "where", "me", "my", "i", "you", "your", "it", "its", "this", "that", "these", "those",
+    "tell", "show", "give", "about", "doing", "trend", "trending", "trends", "market", "data", "latest",
+    "current", "currently", "now", "right", "week", "weeks", "month", "months", "last", "past", "recent",
+    "compare", "between", "please", "can", "could", "would", "should", "much", "many", "any", "some",
+}
+
+# Confidence thresholds for answering without the LLM
+MIN_CONFIDENCE = 0.8
+MIN_MARGIN = 0.08
+PRIMARY_BONUS = 0.1
+FUZZY_PENALTY = 0.9
+FUZZY_CUTOFF = 0.82
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+\+*")
+_PAREN_RE = re.compile(r"\(([^)]*)\)")
+# "Kubernetes & Container Orchestration", "Data Lakes / Lakehouse Architectures"; a bare slash
+# stays joined ("CI/CD", "ISO/SAE 21434")
+_PART_RE = re.compile(r"\s*&\s*|\s+/\s+")
+
+
+def _stem(token: str) -> str:
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> list:
+    """Lowercases, splits on punctuation and drops stopwords so aliases and queries compare equal."""
+    return [_stem(t) for t in _TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+class EntityMatch:
+    """Outcome of a local resolution attempt."""
+
+    def __init__(self, status: str, topic: dict | None = None, confidence: float = 0.0, candidates: list | None = None):
+        self.status = status  # "matched", "ambiguous" or "none"
+        self.topic = topic
+        self.confidence = confidence
+        self.candidates = candidates or []
+
+    @property
+    def primary_name(self):
+        return self.topic.get("primary_name") if self.topic else None
+
+    @property
+    def category_name(self):
+        return self.topic.get("category") if self.topic else None
+
+
+class EntityResolver:
+    """Synonym/alias index over the tech catalog with phrase and typo-tolerant lookup."""
+
+    def __init__(self, catalog: list):
+        self.catalog = catalog
+        # alias tokens -> list of (topic index, is_primary)
+        self.phrases = defaultdict(list)
+        # flat alias table: [topic index, is_primary, summed token idf]
+        self.aliases = []
+        # token -> alias ids containing it
+        self.postings = defaultdict(list)
+        self.max_phrase_len = 1
+
+        for idx, topic in enumerate(catalog):
+            for alias, is_primary in self._aliases_for(topic):
+                tokens = tuple(tokenize(alias))
+                if not tokens or (idx, is_primary) in self.phrases[tokens]:
+                    continue
+                self.phrases[tokens].append((idx, is_primary))
+                self.max_phrase_len = max(self.max_phrase_len, len(tokens))
+                alias_id = len(self.aliases)
+                self.aliases.append([idx, is_primary, tokens])
+                for t in set(tokens):
+                    self.postings[t].append(alias_id)
+
+        n = max(len(catalog), 1)
+        self.idf = {}
+        for t, alias_ids in self.postings.items():
+            topics = {self.aliases[a][0] for a in alias_ids}
+            self.idf[t] = math.log(1 + n / len(topics))
+        for alias in self.aliases:
+            alias[2] = sum(self.idf[t] for t in set(alias[2]))
+
+        self.vocab_by_initial = defaultdict(list)
+        for t in self.postings:
+            if len(t) >= 4:
+                self.vocab_by_initial[t[0]].append(t)
+
+    @staticmethod
+    def _aliases_for(topic: dict):
+        primary = topic.get("primary_name") or ""
+        yield primary, True
+        stripped = _PAREN_RE.sub(" ", primary).strip()
+        if stripped and stripped != primary:
+            yield stripped, True
+        for inner in _PAREN_RE.findall(primary):
+            yield inner, True
+        parts = _PART_RE.split(stripped)
+        if len(parts) > 1:
+            # Each half names the topic on its own ("how is kubernetes doing")
+            for part in parts:
+                yield part, False
+        for syn in topic.get("synonyms", []) or []:
+            yield syn, False
+
+    def _correct(self, tokens: list) -> tuple:
+        """Maps out-of-vocabulary tokens onto their closest catalog token."""
+        corrected, changed = [], False
+        for t in tokens:
+            if t in self.postings or len(t) < 4:
+                corrected.append(t)
+                continue
+            close = difflib.get_close_matches(t, self.vocab_by_initial.get(t[0], []), n=1, cutoff=FUZZY_CUTOFF)
+            if close:
+                corrected.append(close[0])
+                changed = True
+            else:
+                corrected.append(t)
+        return corrected, changed
+
+    def _score(self, tokens: list, penalty: float = 1.0) -> dict:
+        """Scores every topic sharing a token with the query; 1.0 means an alias is fully covered."""
+        scores = {}
+
+        # Contiguous multi-word phrases are the strongest signal
+        for i in range(len(tokens)):
+            for n in range(min(self.max_phrase_len, len(tokens) - i), 0, -1):
+                for idx, is_primary in self.phrases.get(tuple(tokens[i:i + n]), ()):
+                    score = (1.0 + (PRIMARY_BONUS if is_primary else 0.0)) * penalty
+                    scores[idx] = max(scores.get(idx, 0.0), score)
+
+        # Otherwise weight partial alias coverage by token rarity
+        hits = defaultdict(float)
+        for t in set(tokens):
+            for alias_id in self.postings.get(t, ()):
+                hits[alias_id] += self.idf[t]
+        for alias_id, hit in hits.items():
+            idx, is_primary, total = self.aliases[alias_id]
+            score = min(hit / total + (PRIMARY_BONUS if is_primary else 0.0), 0.99) * penalty
+            scores[idx] = max(scores.get(idx, 0.0), score)
+        return scores
+
+    def _decide(self, scores: dict) -> EntityMatch:
+        if not scores:
+            return EntityMatch("none")
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        best_idx, best = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        candidates = [self.catalog[i] for i, s in ranked[:8] if s >= best - 0.3]
+        if best >= MIN_CONFIDENCE and best - runner_up >= MIN_MARGIN:
+            return EntityMatch("matched", self.catalog[best_idx], best, candidates)
+        return EntityMatch("ambiguous", None, best, candidates)
+
+    def resolve(self, query: str) -> EntityMatch:
+        """Resolves a free-text query to a catalog topic, flagging ambiguous or unmatched queries."""
+        tokens = tokenize(query)
+        match = self._decide(self._score(tokens))
+        if match.status == "matched":
+            return match
+
+        # Several topics named outright (e.g. a comparison) is not ambiguity: the first one leads
+        mentioned = self.resolve_all(query)
+        if len(mentioned) > 1:
+            return EntityMatch("matched", mentioned[0], match.confidence, mentioned)
+
+        corrected, changed = self._correct(tokens)
+        if not changed:
+            return match
+        fuzzy = self._decide(self._score(corrected, FUZZY_PENALTY))
+        if fuzzy.status == "none":
+            return match
+        return fuzzy
+
+    def resolve_all(self, query: str, limit: int = 3) -> list:
+        """Returns every topic whose alias phrase appears in the query, in order of first mention."""
+        tokens, _ = self._correct(tokenize(query))
+        found, seen = [], set()
+        i = 0
+        while i < len(tokens):
+            step = 1
+            for n in range(min(self.max_phrase_len, len(tokens) - i), 0, -1):
+                hits = self.phrases.get(tuple(tokens[i:i + n]))
+                if not hits:
+                    continue
+                idx = next((h[0] for h in hits if h[1]), hits[0][0])
+                if idx not in seen:
+                    seen.add(idx)
+                    found.append(self.catalog[idx])
+                step = n
+                break
+            i += step
+        return found[:limit]
@@ -21,6 +21,8 @@ export default function FloatingChat() {
   const [isLoading, setIsLoading] = useState(false)
   
   const messagesEndRef = useRef<HTMLDivElement>(null)
+  // Lets the backend answer follow-ups from this conversation's previous turn
+  const sessionIdRef = useRef(crypto.randomUUID())
 
   const scrollToBottom = () => {
     messagesEndRef.current?.scrollIntoView({ behavior: "smooth" })
@@ -45,16 +47,59 @@ export default function FloatingChat() {
 
     setIsLoading(true)
 
+    const botId = (Date.now() + 1).toString()
+    let received = false
+
+    // Append streamed text to the assistant message (or replace it), creating it on the first token
+    const writeToBot = (text: string, replace = false) => {
+      setMessages(prev => prev.some(m => m.id === botId)
+        ? prev.map(m => m.id === botId ? { ...m, text: replace ? text : m.text + text } : m)
+        : [...prev, { id: botId, role: 'assistant', text }])
+      received = true
+      setIsLoading(false)
+    }
+
     try {
-      const response = await fetch('http://localhost:5003/chat', {
+      const response = await fetch('http://localhost:5003/chat/stream', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ message: msg, user_id: userId })
+        body: JSON.stringify({ message: msg, user_id: userId, session_id: sessionIdRef.current })
       });
-      const data = await response.json()
-      
-      const botMessage: Message = { id: (Date.now() + 1).toString(), role: 'assistant', text: data.reply }
-      setMessages(prev => [...prev, botMessage])
+      if (!response.ok) {
+        // 429/503 carry a user-facing "busy" reply; show it rather than a generic failure
+        const body = await response.json().catch(() => null)
+        if (body?.reply) {
+          writeToBot(body.reply)
+          return
+        }
+        throw new Error(`Chat stream failed: ${response.status}`)
+      }
+      if (!response.body) throw new Error('Chat stream has no body')
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ''
+
+      while (true) {
+        const { value, done } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        // Server-sent events are separated by a blank line
+        const events = buffer.split('\n\n')
+        buffer = events.pop() ?? ''
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1]
+          const data = raw.match(/^data: (.*)$/m)?.[1]
+          if (!event || !data) continue
+
+          const payload = JSON.parse(data)
+          if (event === 'token') writeToBot(payload.text)
+          // A partial answer followed by an error is not an answer
+          else if (event === 'error') writeToBot(payload.message, true)
+        }
+      }
+      if (!received) throw new Error('Chat stream ended without a reply')
     } catch (err) {
       const errorMessage: Message = { id: (Date.now() + 1).toString(), role: 'assistant', text: "I'm sorry, I couldn't reach the AI service right now." }
       setMessages(prev => [...prev, errorMessage])
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import queue
+import threading
+
+
+class HistoryWriter:
+    """Write-behind queue that coalesces chat_history rows into bulk inserts.
+
+    Rows are flushed when `batch_size` accumulate or `flush_interval` seconds pass.
+    The queue is bounded; rows that cannot be queued or inserted are appended to a
+    local JSONL spill file, which is replayed on start and after the database recovers.
+    Spilled lines that cannot be parsed (e.g. torn by a crash mid-write) are moved to a
+    `.quarantine` file next to it instead of blocking the replay.
+    """
+
+    def __init__(self, insert_fn, spill_path: str, max_queue: int = 10000, batch_size: int = 50,
+                 flush_interval: float = 2.0, replay_interval: float = 60.0):
+        self.insert_fn = insert_fn
+        self.spill_path = spill_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.replay_interval = replay_interval
+        self.counters = {"enqueued": 0, "written": 0, "batches": 0, "spilled": 0, "replayed": 0, "quarantined": 0, "failures": 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._spill_lock = threading.Lock()
+        self._thread = None
+        self._last_replay = 0.0
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._try_replay()
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Signals the worker to drain whatever is queued and waits for it to finish."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        # Anything still queued (e.g. the join timed out) must not be lost
+        self._spill(self._drain(self._queue.qsize()))
+
+    def enqueue(self, row: dict) -> bool:
+        """Never blocks the caller: a full queue spills straight to disk."""
+        self.counters["enqueued"] += 1
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self._spill([row])
+            return False
+
+    def _drain(self, limit: int) -> list:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _next_batch(self) -> list:
+        try:
+            first = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, rows: list) -> bool:
+        try:
+            self.insert_fn(rows)
+        except Exception as e:
+            print(f"    [!] chat_history bulk insert of {len(rows)} rows failed, spilling to disk: {e}")
+            self.counters["failures"] += 1
+            self._spill(rows)
+            return False
+        self.counters["written"] += len(rows)
+        self.counters["batches"] += 1
+        return True
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = self._next_batch() if not self._stop.is_set() else self._drain(self.batch_size)
+            if batch and self._write(batch) and time.monotonic() - self._last_replay > self.replay_interval:
+                # The database is reachable again; push out anything spilled earlier
+                self._try_replay()
+
+    def _spill(self, rows: list):
+        if not rows:
+            return
+        with self._spill_lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.spill_path)), exist_ok=True)
+            with open(self.spill_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row, default=str) + "\n")
+        self.counters["spilled"] += len(rows)
+
+    def _try_replay(self):
+        # A broken spill file must never keep the writer from starting or kill its thread
+        try:
+            self.replay()
+        except Exception as e:
+            print(f"    [!] chat_history spill replay failed, will retry later: {e}")
+            self.counters["failures"] += 1
+
+    def _read_spilled(self, path: str) -> list:
+        rows, bad = [], []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rows.append(json.loads(line))
+                except ValueError:
+                    bad.append(line if line.endswith("\n") else line + "\n")
+        if bad:
+            with open(f"{self.spill_path}.quarantine", "a", encoding="utf-8") as f:
+                f.writelines(bad)
+            self.counters["quarantined"] += len(bad)
+            print(f"    [!] Quarantined {len(bad)} malformed spilled chat_history lines to {self.spill_path}.quarantine")
+        return rows
+
+    def replay(self):
+        """Re-inserts spilled rows in batches; rows that still fail are spilled again."""
+        self._last_replay = time.monotonic()
+        replaying = f"{self.spill_path}.replaying"
+        with self._spill_lock:
+            if os.path.exists(self.spill_path):
+                if os.path.exists(replaying):
+                    # A previous replay was interrupted; fold new spills into it
+                    with open(self.spill_path, encoding="utf-8") as src, open(replaying, "a", encoding="utf-8") as dst:
+                        dst.write(src.read())
+                    os.remove(self.spill_path)
+                else:
+                    os.replace(self.spill_path, replaying)
+            if not os.path.exists(replaying):
+                return
+
+        rows = self._read_spilled(replaying)
+        replayed = 0
+        for i in range(0, len(rows), self.batch_size):
+            batch = rows[i:i + self.batch_size]
+            if not self._write(batch):
+                self._spill(rows[i + self.batch_size:])
+                break
+            replayed += len(batch)
+        # Removed only once every row is either inserted or spilled again
+        os.remove(replaying)
+        self.counters["replayed"] += replayed
+        if rows:
+            print(f"    -> Replayed {replayed}/{len(rows)} spilled chat_history rows")
+
+    def stats(self) -> dict:
+        return dict(self.counters, queued=self._queue.qsize())
@@ -0,0 +1,90 @@
+"""
+Concurrency sweep against a running chat_api instance.
+
+Run:  python load_test_chat.py --url http://localhost:5003/chat --levels 1,5,10,25,50 --requests 100
+
+Each level keeps `concurrency` requests in flight until `requests` have completed and
+reports throughput plus latency percentiles, so a non-blocking server should show
+req/s rising with concurrency while a blocking one stays flat.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+DEFAULT_QUERIES = [
+    "How is Agentic AI trending?",
+    "Show me GitHub activity for vector databases over the last 3 months",
+    "What are the latest job numbers for LiDAR?",
+    "Compare DDR5 memory vs ARM architecture",
+    "How are humanoid robots doing?",
+    "Is MLOps hiring growing?",
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+async def run_level(client, url, concurrency, total, queries, extra=None, error_markers=()):
+    """Keeps `concurrency` posts in flight until `total` finish; a reply containing any of
+    `error_markers` counts as an error even with a 2xx status."""
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                resp = await client.post(url, json={"message": queries[i % len(queries)], **(extra or {})})
+                resp.raise_for_status()
+                if any(marker in resp.text for marker in error_markers):
+                    raise RuntimeError("error reply")
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "completed": len(latencies),
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": statistics.fmean(latencies) if latencies else 0.0,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Throughput vs concurrency sweep for /chat")
+    parser.add_argument("--url", default="http://localhost:5003/chat")
+    parser.add_argument("--levels", default="1,5,10,25,50", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=100, help="Requests per level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        print(f"{'conc':>5} {'ok':>6} {'err':>5} {'req/s':>8} {'p50 s':>8} {'p95 s':>8} {'mean s':>8}")
+        for level in levels:
+            r = await run_level(client, args.url, level, args.requests, DEFAULT_QUERIES)
+            print(f"{r['concurrency']:>5} {r['completed']:>6} {r['errors']:>5} {r['throughput']:>8.2f} "
+                  f"{r['p50']:>8.3f} {r['p95']:>8.3f} {r['mean']:>8.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
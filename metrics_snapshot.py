@@ -0,0 +1,230 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+from query_planner import METRICS, TABLE
+
+INT_METRICS = {"jobs", "github", "news"}
+PAGE_SIZE = 1000
+_WEEK_OPS = {
+    "eq": np.equal, "gt": np.greater, "gte": np.greater_equal,
+    "lt": np.less, "lte": np.less_equal, "neq": np.not_equal,
+}
+_REDUCERS = {"mean": np.nanmean, "sum": np.nansum, "max": np.nanmax, "min": np.nanmin}
+
+
+class MetricsSnapshot:
+    """Read-through, in-memory columnar copy of tech_metrics.
+
+    Each topic holds a sorted array of iso_week labels plus one float array per metric,
+    so range, latest-value and aggregate queries are answered without a network hop.
+    """
+
+    def __init__(self, path: str | None = None, refresh_interval: float = 900.0):
+        self.path = path
+        self.refresh_interval = refresh_interval
+        self.watermark = None       # newest iso_week held
+        self.refreshed_at = 0.0
+        self._topics = {}           # topic -> {"weeks": ndarray[str], metric: ndarray[float]}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_rows(cls, rows: list) -> "MetricsSnapshot":
+        """Builds an unpersisted snapshot over already-fetched tech_metrics rows."""
+        snapshot = cls()
+        snapshot._merge(rows)
+        snapshot.refreshed_at = time.monotonic()
+        return snapshot
+
+    @property
+    def loaded(self) -> bool:
+        return self.refreshed_at > 0
+
+    @property
+    def topics(self) -> list:
+        return list(self._topics)
+
+    # ── Loading ───────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _fetch(supabase, since: str | None) -> list:
+        """Pages through tech_metrics, optionally only from the `since` week onward."""
+        rows, start = [], 0
+        while True:
+            query = supabase.table(TABLE).select("topic_name, iso_week, " + ", ".join(METRICS))
+            if since:
+                # gte rather than gt: the watermark week may still be receiving updates
+                query = query.gte("iso_week", since)
+            page = query.order("iso_week").range(start, start + PAGE_SIZE - 1).execute().data
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                return rows
+            start += PAGE_SIZE
+
+    def _merge(self, rows: list):
+        """Upserts rows into per-topic arrays, rebuilding only the topics they touch."""
+        touched = {}
+        for row in rows:
+            touched.setdefault(row["topic_name"], []).append(row)
+
+        topics = dict(self._topics)
+        for topic, new_rows in touched.items():
+            by_week = {}
+            existing = topics.get(topic)
+            if existing is not None:
+                for i, week in enumerate(existing["weeks"]):
+                    by_week[str(week)] = [existing[m][i] for m in METRICS]
+            for row in new_rows:
+                by_week[row["iso_week"]] = [np.nan if row.get(m) is None else float(row[m]) for m in METRICS]
+
+            weeks = sorted(by_week)
+            values = np.array([by_week[w] for w in weeks], dtype=np.float64).reshape(len(weeks), len(METRICS))
+            arrays = {"weeks": np.array(weeks, dtype="<U10")}
+            for j, m in enumerate(METRICS):
+                arrays[m] = np.ascontiguousarray(values[:, j])
+            topics[topic] = arrays
+
+        if rows:
+            newest = max(r["iso_week"] for r in rows)
+            self.watermark = max(self.watermark or newest, newest)
+        # Readers always see either the old or the new mapping, never a partial one
+        self._topics = topics
+
+    def refresh(self, supabase) -> int:
+        """Fetches only weeks at or after the watermark (everything on first load); returns rows merged."""
+        with self._lock:
+            if not self._topics and self.path:
+                self.load_file()
+            rows = self._fetch(supabase, self.watermark)
+            self._merge(rows)
+            self.refreshed_at = time.monotonic()
+            if self.path and rows:
+                self.save_file()
+            return len(rows)
+
+    def ensure_fresh(self, supabase):
+        """Loads on first use, then refreshes incrementally once refresh_interval has passed."""
+        if not self.loaded:
+            self.refresh(supabase)
+        elif time.monotonic() - self.refreshed_at > self.refresh_interval and not self._lock.locked():
+            # Concurrent callers keep serving the current snapshot while one thread refreshes
+            self.refresh(supabase)
+
+    # ── Persistence ───────────────────────────────────────────────────────
+
+    def save_file(self):
+        topics = self._topics
+        names = list(topics)
+        counts = [len(topics[t]["weeks"]) for t in names]
+        payload = {
+            "topics": np.array(names, dtype=str),
+            "counts": np.array(counts, dtype=np.int64),
+            "weeks": np.concatenate([topics[t]["weeks"] for t in names]) if names else np.array([], dtype="<U10"),
+            "watermark": np.array(self.watermark or ""),
+        }
+        for m in METRICS:
+            payload[m] = np.concatenate([topics[t][m] for t in names]) if names else np.array([], dtype=np.float64)
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, **payload)
+        os.replace(tmp, self.path)
+
+    def load_file(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                topics, offset = {}, 0
+                for name, count in zip(data["topics"], data["counts"]):
+                    end = offset + int(count)
+                    arrays = {"weeks": data["weeks"][offset:end].astype("<U10")}
+                    for m in METRICS:
+                        arrays[m] = data[m][offset:end].copy()
+                    topics[str(name)] = arrays
+                    offset = end
+                self.watermark = str(data["watermark"]) or None
+        except Exception as e:
+            print(f"    [!] Ignoring unreadable snapshot file {self.path}: {e}")
+            return False
+        self._topics = topics
+        return True
+
+    # ── Queries ───────────────────────────────────────────────────────────
+
+    def _window(self, topic: str, week_filters=(), last_n: int | None = None):
+        arrays = self._topics.get(topic)
+        if arrays is None:
+            return None, None
+        mask = np.ones(len(arrays["weeks"]), dtype=bool)
+        for op, value in week_filters:
+            mask &= _WEEK_OPS[op](arrays["weeks"], value)
+        idx = np.flatnonzero(mask)
+        if last_n:
+            idx = idx[-last_n:]
+        return arrays, idx
+
+    def series(self, topic: str, metrics=METRICS, week_filters=(), last_n: int | None = None) -> list:
+        """Rows for a topic, newest first, in the same shape Supabase returns."""
+        arrays, idx = self._window(topic, week_filters, last_n)
+        if arrays is None:
+            return []
+        rows = []
+        for i in idx[::-1]:
+            row = {"topic_name": topic, "iso_week": str(arrays["weeks"][i])}
+            for m in metrics:
+                v = arrays[m][i]
+                row[m] = None if np.isnan(v) else (int(v) if m in INT_METRICS else float(v))
+            rows.append(row)
+        return rows
+
+    def latest(self, topic: str, metrics=METRICS) -> dict | None:
+        rows = self.series(topic, metrics, last_n=1)
+        return rows[0] if rows else None
+
+    def aggregate(self, topic: str, fn: str, metrics=METRICS, week_filters=(), last_n: int | None = None) -> dict | None:
+        """Reduces each metric over the selected window with mean/sum/max/min, ignoring gaps."""
+        arrays, idx = self._window(topic, week_filters, last_n)
+        if arrays is None or not len(idx):
+            return None
+        out = {
+            "topic_name": topic, "aggregate": fn, "weeks": int(len(idx)),
+            "from_week": str(arrays["weeks"][idx[0]]), "to_week": str(arrays["weeks"][idx[-1]]),
+        }
+        for m in metrics:
+            values = arrays[m][idx]
+            if not np.all(np.isnan(values)):
+                out[m] = float(_REDUCERS[fn](values))
+        return out
+
+    def execute_plan(self, plan) -> list | None:
+        """Answers a QueryPlan from memory; None means the plan needs the database."""
+        if plan.table != TABLE or plan.order not in (None, "iso_week"):
+            return None
+        topics, week_filters = None, []
+        for op, column, value in plan.filters:
+            if column == "topic_name" and op == "eq":
+                topics = [value]
+            elif column == "topic_name" and op == "in_":
+                topics = list(value)
+            elif column == "iso_week" and op in _WEEK_OPS:
+                week_filters.append((op, value))
+            else:
+                return None
+        if topics is None:
+            return None
+
+        selected = [c.strip() for c in plan.select.split(",")]
+        metrics = METRICS if "*" in selected else tuple(m for m in METRICS if m in selected)
+        per_topic = -(-plan.limit // len(topics)) if plan.limit else None
+
+        if plan.aggregate:
+            summaries = (self.aggregate(t, plan.aggregate, metrics, week_filters, per_topic) for t in topics)
+            return [s for s in summaries if s]
+
+        rows = [r for t in topics for r in self.series(t, metrics, week_filters, per_topic)]
+        rows.sort(key=lambda r: r["iso_week"], reverse=plan.desc)
+        return rows[:plan.limit] if plan.limit else rows
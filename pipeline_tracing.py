@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+TRACE_LOG = os.getenv("TRACE_LOG", "1") != "0"
+RESERVOIR_SIZE = int(os.getenv("TRACE_RESERVOIR_SIZE", "2048"))
+QUANTILES = (0.5, 0.95, 0.99)
+# Fixed histogram buckets (seconds) so /metrics series from every worker can be summed
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+
+def new_request(request_id: str | None = None) -> str:
+    """Starts a traced request in the current context and returns its id."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+
+class Span:
+    """One timed pipeline stage; attributes such as token counts are attached with set()."""
+
+    def __init__(self, stage: str, attrs: dict):
+        self.stage = stage
+        self.attrs = attrs
+        self.request_id = request_id_var.get()
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+        return self
+
+    def record_llm_usage(self, response):
+        """Copies Gemini usage metadata (when present) onto the span."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return self
+        return self.set(
+            prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+            output_tokens=getattr(usage, "candidates_token_count", None) or 0,
+        )
+
+
+class StageMetrics:
+    """Per-stage latency histograms, reservoirs and counters behind the /metrics endpoint.
+
+    The histograms are what /metrics exports; the reservoirs only feed snapshot()'s
+    in-process percentiles for JSON reports such as the benchmark's.
+    """
+
+    def __init__(self, reservoir_size: int = RESERVOIR_SIZE):
+        self._lock = threading.Lock()
+        self._samples = defaultdict(lambda: deque(maxlen=reservoir_size))
+        self._buckets = defaultdict(lambda: [0] * (len(LATENCY_BUCKETS) + 1))  # last slot is +Inf
+        self._sum = defaultdict(float)
+        self._count = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._tokens = defaultdict(int)   # (stage, kind) -> total
+        self._collectors = []
+
+    def observe(self, span: Span):
+        with self._lock:
+            self._samples[span.stage].append(span.duration)
+            self._buckets[span.stage][bisect.bisect_left(LATENCY_BUCKETS, span.duration)] += 1
+            self._sum[span.stage] += span.duration
+            self._count[span.stage] += 1
+            if span.error:
+                self._errors[span.stage] += 1
+            for kind in ("prompt_tokens", "output_tokens"):
+                if span.attrs.get(kind):
+                    self._tokens[(span.stage, kind)] += span.attrs[kind]
+
+    def reset(self):
+        """Drops every sample and counter; collectors stay registered."""
+        with self._lock:
+            for store in (self._samples, self._buckets, self._sum, self._count, self._errors, self._tokens):
+                store.clear()
+
+    def stages(self) -> list:
+        with self._lock:
+            return sorted(self._count)
+
+    def snapshot(self) -> dict:
+        """Plain-dict view of every stage, for JSON reports."""
+        out = {}
+        for stage in self.stages():
+            with self._lock:
+                count, total, errors = self._count[stage], self._sum[stage], self._errors[stage]
+                tokens = {k: v for (s, k), v in self._tokens.items() if s == stage}
+            out[stage] = {
+                "count": count, "errors": errors, "mean": total / count if count else 0.0,
+                **{f"p{int(q * 100)}": v for q, v in self.quantiles(stage).items()},
+                **tokens,
+            }
+        return out
+
+    def quantiles(self, stage: str) -> dict:
+        with self._lock:
+            samples = sorted(self._samples.get(stage, ()))
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def register_collector(self, fn):
+        """fn() -> [(name, type, help, [(labels dict, value), ...]), ...] rendered on every scrape."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = [
+            "# HELP chat_stage_latency_seconds Chat pipeline stage latency.",
+            "# TYPE chat_stage_latency_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._count)
+            sums, counts, errors = dict(self._sum), dict(self._count), dict(self._errors)
+            buckets = {stage: list(self._buckets[stage]) for stage in stages}
+            tokens = dict(self._tokens)
+        for stage in stages:
+            cumulative = 0
+            for le, n in zip(LATENCY_BUCKETS + ("+Inf",), buckets[stage]):
+                cumulative += n
+                lines.append(f'chat_stage_latency_seconds_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'chat_stage_latency_seconds_sum{{stage="{stage}"}} {sums[stage]:.6f}')
+            lines.append(f'chat_stage_latency_seconds_count{{stage="{stage}"}} {counts[stage]}')
+
+        lines += ["# HELP chat_stage_errors_total Chat pipeline stages that raised.", "# TYPE chat_stage_errors_total counter"]
+        lines += [f'chat_stage_errors_total{{stage="{s}"}} {errors.get(s, 0)}' for s in stages]
+
+        lines += ["# HELP chat_llm_tokens_total Gemini tokens by stage.", "# TYPE chat_llm_tokens_total counter"]
+        lines += [f'chat_llm_tokens_total{{stage="{s}",kind="{k}"}} {v}' for (s, k), v in sorted(tokens.items())]
+
+        for collect in self._collectors:
+            try:
+                families = collect()
+            except Exception as e:
+                print(f"    [!] Metrics collector failed: {e}")
+                continue
+            for name, mtype, help_text, samples in families:
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {mtype}"]
+                for labels, value in samples:
+                    label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                    lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = StageMetrics()
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Times a pipeline stage, logs it as one JSON line and feeds the latency metrics."""
+    sp = Span(stage, attrs)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = type(e).__name__
+        raise
+    finally:
+        sp.duration = time.perf_counter() - sp.started
+        metrics.observe(sp)
+        if TRACE_LOG:
+            record = {"request_id": sp.request_id, "stage": stage, "ms": round(sp.duration * 1000, 2), **sp.attrs}
+            if sp.error:
+                record["error"] = sp.error
+            print(f"    [trace] {json.dumps(record, default=str)}")
@@ -0,0 +1,300 @@
+import re
+import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+TABLE = "tech_metrics"
+METRICS = ("jobs", "github", "trends", "news")
+DEFAULT_WEEKS = 12
+MAX_WEEKS = 104
+
+# Only these supabase-py filter builders may appear in a plan
+ALLOWED_OPS = {"eq", "neq", "gt", "gte", "lt", "lte", "in_"}
+
+METRIC_KEYWORDS = {
+    "jobs": ("job", "jobs", "hiring", "vacancy", "vacancies", "openings", "roles", "demand", "employment"),
+    "github": ("github", "repo", "repos", "repositories", "repository", "developer", "developers", "code", "open source", "open-source"),
+    "trends": ("search", "searches", "interest", "google", "popularity", "curiosity"),
+    "news": ("news", "articles", "media", "headlines", "press", "coverage"),
+}
+
+_ISO_WEEK_RE = re.compile(r"\b(\d{4})-?w(\d{1,2})\b", re.I)
+_LAST_N_RE = re.compile(r"\b(?:last|past|previous|recent)\s+(\d{1,3})\s+(week|month|year)s?\b", re.I)
+_LAST_UNIT_RE = re.compile(r"\b(?:last|past|previous|this)\s+(week|month|quarter|year)\b", re.I)
+_LATEST_RE = re.compile(r"\b(latest|current|currently|right now|today|this week|now)\b", re.I)
+_COMPARE_RE = re.compile(r"\b(compare|compared|comparison|vs\.?|versus|against|or)\b", re.I)
+
+UNIT_WEEKS = {"week": 1, "month": 4, "quarter": 13, "year": 52}
+
+AGGREGATE_KEYWORDS = {
+    "mean": ("average", "avg", "mean"),
+    "sum": ("total", "sum", "cumulative"),
+    "max": ("peak", "highest", "max", "maximum"),
+    "min": ("lowest", "min", "minimum"),
+}
+
+
+class Intent(NamedTuple):
+    shape: str            # "latest", "last_n_weeks", "week_range" or "compare"
+    metrics: tuple = ()   # metric columns to project, empty means all
+    weeks: int = DEFAULT_WEEKS
+    week_from: str | None = None
+    week_to: str | None = None
+    aggregate: str | None = None  # "mean", "sum", "max" or "min" over the selected window
+
+
+class QueryPlan(NamedTuple):
+    shape: str
+    table: str
+    select: str
+    filters: tuple        # ((op, column, value), ...)
+    order: str | None = "iso_week"
+    desc: bool = True
+    limit: int | None = None
+    aggregate: str | None = None
+
+
+def _iso_week(year: str, week: str) -> str:
+    return f"{int(year)}-W{int(week):02d}"
+
+
+def parse_intent(user_query: str, topic_count: int = 1) -> Intent:
+    """Lightweight regex parse of what slice of tech_metrics the question needs."""
+    text = user_query.lower()
+    metrics = tuple(m for m in METRICS if any(re.search(rf"\b{re.escape(k)}\b", text) for k in METRIC_KEYWORDS[m]))
+
+    weeks_found = [_iso_week(y, w) for y, w in _ISO_WEEK_RE.findall(text)]
+    window = None
+    m = _LAST_N_RE.search(text)
+    if m:
+        window = int(m.group(1)) * UNIT_WEEKS[m.group(2).lower()]
+    else:
+        m = _LAST_UNIT_RE.search(text)
+        if m and m.group(0).lower() != "this week":
+            window = UNIT_WEEKS[m.group(1).lower()]
+    weeks = min(max(window or DEFAULT_WEEKS, 1), MAX_WEEKS)
+    aggregate = next((a for a, kws in AGGREGATE_KEYWORDS.items() if any(re.search(rf"\b{k}\b", text) for k in kws)), None)
+
+    if topic_count > 1 and _COMPARE_RE.search(text):
+        return Intent("compare", metrics, weeks, aggregate=aggregate)
+    if len(weeks_found) >= 2:
+        start, end = sorted(weeks_found[:2])
+        return Intent("week_range", metrics, weeks, start, end, aggregate)
+    if len(weeks_found) == 1:
+        if re.search(r"\b(since|after|from)\b", text):
+            return Intent("week_range", metrics, weeks, weeks_found[0], None, aggregate)
+        return Intent("week_range", metrics, weeks, weeks_found[0], weeks_found[0], aggregate)
+    if window is None and aggregate is None and _LATEST_RE.search(text):
+        return Intent("latest", metrics, 1)
+    return Intent("last_n_weeks", metrics, weeks, aggregate=aggregate)
+
+
+@lru_cache(maxsize=1024)
+def compile_plan(intent: Intent, topics: tuple) -> QueryPlan:
+    """Turns an intent plus resolved topic(s) into a fixed, parameterized query shape."""
+    columns = intent.metrics or METRICS
+    select = ", ".join(("topic_name", "iso_week") + tuple(columns))
+
+    if intent.shape == "compare":
+        return QueryPlan("compare", TABLE, select, (("in_", "topic_name", topics),),
+                         limit=intent.weeks * len(topics), aggregate=intent.aggregate)
+
+    filters = (("eq", "topic_name", topics[0]),)
+    if intent.shape == "latest":
+        return QueryPlan("latest", TABLE, select, filters, limit=1)
+    if intent.shape == "week_range":
+        if intent.week_from:
+            filters += (("gte", "iso_week", intent.week_from),)
+        if intent.week_to:
+            filters += (("lte", "iso_week", intent.week_to),)
+        return QueryPlan("week_range", TABLE, select, filters, limit=MAX_WEEKS, aggregate=intent.aggregate)
+    return QueryPlan("last_n_weeks", TABLE, select, filters, limit=intent.weeks, aggregate=intent.aggregate)
+
+
+def plan_query(topics: list, user_query: str) -> QueryPlan:
+    """Picks a query shape for the resolved topic(s); topics[0] is the primary entity."""
+    topics = tuple(dict.fromkeys(t for t in topics if t))
+    intent = parse_intent(user_query, len(topics))
+    if intent.shape != "compare":
+        topics = topics[:1]
+    return compile_plan(intent, topics)
+
+
+def _build_query(supabase, plan: QueryPlan):
+    query = supabase.table(plan.table).select(plan.select)
+    for op, column, value in plan.filters:
+        if op not in ALLOWED_OPS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        query = getattr(query, op)(column, list(value) if op == "in_" else value)
+    if plan.order:
+        query = query.order(plan.order, desc=plan.desc)
+    return query
+
+
+def execute_plan(supabase, plan: QueryPlan, page_size: int | None = None) -> list:
+    """Builds the supabase-py request from the plan; no generated code is ever evaluated.
+
+    With page_size, an unlimited plan is fetched page by page (PostgREST caps a response at 1000 rows).
+    """
+    if page_size and not plan.limit:
+        rows, start = [], 0
+        while True:
+            page = _build_query(supabase, plan).range(start, start + page_size - 1).execute().data
+            rows.extend(page)
+            if len(page) < page_size:
+                break
+            start += page_size
+    else:
+        query = _build_query(supabase, plan)
+        if plan.limit:
+            query = query.limit(plan.limit)
+        rows = query.execute().data
+    return aggregate_rows(rows, plan) if plan.aggregate else rows
+
+
+def aggregate_rows(rows: list, plan: QueryPlan) -> list:
+    """Reduces fetched rows to one summary row per topic for aggregate plans."""
+    reducers = {"mean": lambda v: sum(v) / len(v), "sum": sum, "max": max, "min": min}
+    by_topic = {}
+    for row in rows:
+        by_topic.setdefault(row.get("topic_name"), []).append(row)
+
+    summary = []
+    for topic, topic_rows in by_topic.items():
+        weeks = sorted(r["iso_week"] for r in topic_rows)
+        out = {"topic_name": topic, "aggregate": plan.aggregate, "from_week": weeks[0], "to_week": weeks[-1], "weeks": len(weeks)}
+        for metric in METRICS:
+            values = [r[metric] for r in topic_rows if r.get(metric) is not None]
+            if values:
+                out[metric] = reducers[plan.aggregate](values)
+        summary.append(out)
+    return summary
+
+
+_SCHEMA_TABLE_RE = re.compile(r"^\s*Table:\s*(?:\w+\.)?(\w+)", re.M)
+_SCHEMA_COLUMN_RE = re.compile(r"^\s*-\s*(\w+)\s*\((\w+)", re.M)
+_SCHEMA_TYPES = {"integer": int, "double": float, "varchar": str, "uuid": str, "timestamp": str, "text": str}
+
+
+def parse_schema(schema_text: str) -> dict:
+    """Reads the DB_SCHEMA description into {table: {column: python type}}."""
+    tables = {}
+    blocks = _SCHEMA_TABLE_RE.split(schema_text)
+    for name, body in zip(blocks[1::2], blocks[2::2]):
+        tables[name] = {col: _SCHEMA_TYPES.get(kind.lower(), str) for col, kind in _SCHEMA_COLUMN_RE.findall(body)}
+    return tables
+
+
+def _coerce(value, kind, column: str):
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Value {value!r} is not valid for column {column}")
+
+
+def plan_from_spec(spec: dict, schema: dict, topics: set, primary_name: str | None = None) -> QueryPlan:
+    """Validates a declarative query spec from the LLM against the schema and compiles it to a QueryPlan.
+
+    Raises ValueError for anything outside the schema, the allowed operators or the known topics;
+    every plan must be scoped to named topics so a bad spec can never scan the whole table, and
+    to primary_name when given so the answer's topic and its data cannot disagree.
+    """
+    table = spec.get("table")
+    if table not in schema:
+        raise ValueError(f"Unknown table: {table}")
+    columns = schema[table]
+
+    select = list(dict.fromkeys(["topic_name", "iso_week"] + list(spec.get("select") or METRICS)))
+    unknown = [c for c in select if c not in columns]
+    if unknown:
+        raise ValueError(f"Unknown columns: {unknown}")
+
+    filters, scoped = [], set()
+    for f in spec.get("filters") or []:
+        op, column = f.get("op"), f.get("column")
+        if op not in ALLOWED_OPS:
+            raise ValueError(f"Unsupported filter operator: {op}")
+        if column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        if op == "in_":
+            value = tuple(_coerce(v, columns[column], column) for v in f.get("values") or [])
+            if not value:
+                raise ValueError(f"Empty in_ filter on {column}")
+        else:
+            value = _coerce(f.get("value"), columns[column], column)
+        if column == "topic_name":
+            named = set(value) if op == "in_" else {value}
+            if op not in ("eq", "in_") or not named <= topics:
+                raise ValueError(f"Topic filter must name tracked topics: {value!r}")
+            scoped |= named
+        filters.append((op, column, value))
+    if not scoped:
+        raise ValueError("Plan is not scoped to any topic")
+    if primary_name and primary_name not in scoped:
+        raise ValueError(f"Plan is scoped to {sorted(scoped)}, not the identified topic {primary_name!r}")
+
+    order = spec.get("order") or "iso_week"
+    if order not in columns:
+        raise ValueError(f"Unknown order column: {order}")
+    limit = spec.get("limit")
+    limit = min(max(int(limit), 1), MAX_WEEKS * len(scoped)) if limit else DEFAULT_WEEKS * len(scoped)
+    aggregate = spec.get("aggregate") or None
+    if aggregate and aggregate not in AGGREGATE_KEYWORDS:
+        raise ValueError(f"Unsupported aggregate: {aggregate}")
+
+    shape = "compare" if len(scoped) > 1 else "llm"
+    return QueryPlan(shape, table, ", ".join(select), tuple(filters), order, bool(spec.get("desc", True)), limit, aggregate)
+
+
+def plan_topics(plan: QueryPlan) -> set:
+    """Topics a plan is scoped to by its topic_name filter."""
+    for op, column, value in plan.filters:
+        if column == "topic_name":
+            return {value} if op == "eq" else set(value)
+    return set()
+
+
+def shift_iso_week(week: str, weeks: int) -> str:
+    """The ISO week label `weeks` weeks after (negative: before) `week`."""
+    year, num = week.split("-W")
+    year, num, _ = (datetime.date.fromisocalendar(int(year), int(num), 1) + datetime.timedelta(weeks=weeks)).isocalendar()
+    return f"{year}-W{num:02d}"
+
+
+def merge_plans(plans: list, latest_week: str | None) -> QueryPlan | None:
+    """One in_() query whose rows cover every plan; None if any plan cannot be merged.
+
+    Only topic/week-filtered plans qualify. Open-ended windows ("last N weeks") become a
+    week lower bound counted back from latest_week, so each topic gets its own N weeks.
+    """
+    topics, columns, lowers, uppers = set(), set(), [], []
+    for plan in plans:
+        if plan.table != TABLE or plan.order not in (None, "iso_week"):
+            return None
+        lower = upper = None
+        for op, column, value in plan.filters:
+            if column == "topic_name" and op in ("eq", "in_"):
+                topics |= {value} if op == "eq" else set(value)
+            elif column == "iso_week" and op in ("gte", "eq"):
+                lower = value
+                upper = value if op == "eq" else upper
+            elif column == "iso_week" and op == "lte":
+                upper = value
+            else:
+                return None
+        if lower is None:
+            if not (plan.limit and latest_week):
+                return None
+            per_topic = -(-plan.limit // max(1, len(plan_topics(plan))))
+            lower = shift_iso_week(latest_week, -(per_topic - 1))
+        lowers.append(lower)
+        uppers.append(upper)
+        columns |= {c.strip() for c in plan.select.split(",")}
+
+    if not plans or not topics:
+        return None
+    filters = (("in_", "topic_name", tuple(sorted(topics))), ("gte", "iso_week", min(lowers)))
+    if all(uppers):
+        filters += (("lte", "iso_week", max(uppers)),)
+    select = ", ".join(["topic_name", "iso_week"] + [m for m in METRICS if m in columns or "*" in columns])
+    return QueryPlan("batch", TABLE, select, filters, limit=None)
@@ -1,35 +1,95 @@
 import os
 import json
+import time
+import asyncio
+import functools
 import traceback
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from supabase import create_client, Client
-from google import genai
-from google.genai import types
+from catalog_artifact import load_catalog
+from query_planner import QueryPlan, plan_query, execute_plan, merge_plans, plan_topics, parse_schema, plan_from_spec, ALLOWED_OPS, AGGREGATE_KEYWORDS
+from answer_cache import AnswerCache, make_backend
+from metrics_snapshot import MetricsSnapshot
+from context_compactor import compact_rows, describe_rows
+from pipeline_tracing import span
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
-if not SUPABASE_URL or not SUPABASE_KEY:
-    raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file.")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# Initialize Gemini
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
-    raise ValueError("Missing GEMINI_API_KEY in .env file.")
-client = genai.Client(api_key=GEMINI_API_KEY)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+
 # We use a fast, high-quality model for reasoning and generation
 MODEL_NAME = os.getenv("GEMINI_MODEL", "gemini-3-flash-preview")
 
-# Load Master Tech Data locally to help with entity extraction
-with open("master_tech_data.json", "r", encoding="utf-8") as f:
-    master_data = json.load(f)
-    
-# Extract simple mapper for LLM context
-tech_catalog = [{"primary_name": t.get("primary_name"), "category": t.get("category"), "synonyms": t.get("synonyms", [])} for t in master_data]
+# Master Tech Data plus its precompiled alias index, loaded on first use
+CATALOG_SOURCE = os.getenv("TECH_CATALOG_PATH", os.path.join(BASE_DIR, "master_tech_data.json"))
+CATALOG_ARTIFACT = os.getenv("TECH_CATALOG_ARTIFACT", os.path.join(CACHE_DIR, "tech_catalog.pickle"))
+
+# Clients and the catalog are created lazily, once per process, so importing this module
+# is cheap and forked/spawned workers never share connections
+_shared = {}
+_shared_lock = threading.Lock()
+
+def _shared_instance(name: str, factory):
+    instance = _shared.get(name)
+    if instance is None:
+        with _shared_lock:
+            instance = _shared.get(name)
+            if instance is None:
+                instance = _shared[name] = factory()
+    return instance
+
+def _create_supabase():
+    from supabase import create_client
+    url = os.getenv("SUPABASE_URL")
+    key = os.getenv("SUPABASE_SERVICE_ROLE_KEY") or os.getenv("SUPABASE_ANON_KEY")
+    if not url or not key:
+        raise ValueError("Missing SUPABASE_URL or SUPABASE_KEY in .env file.")
+    return create_client(url, key)
+
+def _create_gemini():
+    from google import genai
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("Missing GEMINI_API_KEY in .env file.")
+    return genai.Client(api_key=api_key)
+
+def get_supabase():
+    """Shared Supabase client, created on first use."""
+    return _shared_instance("supabase", _create_supabase)
+
+def get_client():
+    """Shared Gemini client, created on first use."""
+    return _shared_instance("client", _create_gemini)
+
+def get_catalog() -> dict:
+    """The precompiled catalog artifact: {"catalog", "topics", "resolver"}."""
+    return _shared_instance("catalog", lambda: load_catalog(CATALOG_SOURCE, CATALOG_ARTIFACT))
+
+def get_entity_resolver():
+    # Local alias index so confidently matched queries never reach the LLM
+    return get_catalog()["resolver"]
+
+def configure(**instances):
+    """Installs ready-made clients (supabase=..., client=...) in place of the lazily built ones."""
+    with _shared_lock:
+        _shared.update(instances)
+
+_LAZY_ATTRIBUTES = {
+    "supabase": get_supabase,
+    "client": get_client,
+    "entity_resolver": get_entity_resolver,
+    "tech_catalog": lambda: get_catalog()["catalog"],
+}
+
+def __getattr__(name: str):
+    # Keeps rag_pipeline.supabase / .client / .tech_catalog working without import-time setup
+    if name in _LAZY_ATTRIBUTES:
+        return _LAZY_ATTRIBUTES[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # We let the LLM know about the shape of the database tables
 DB_SCHEMA = """
@@ -44,16 +104,155 @@ Columns:
 - news (integer): News article volume
 - created_at (timestamp)
 """
+# Column types the LLM's query specs are validated against
+DB_COLUMNS = parse_schema(DB_SCHEMA)
 
-def step_2_identify_entities(user_query: str) -> dict:
-    """Uses LLM to identify tech name and assign primary_name and category based on master_tech_data."""
-    print(" [Step 2] 🧠 Identifying technology entities...")
-    
-    prompt = f"""
+# "fused": one structured call returns the entity and a query spec; "separate": entity only, regex planner
+PLANNING_MODE = os.getenv("PLANNING_MODE", "fused")
+
+# Per-stage deadlines (seconds) for the async pipeline used by chat_api
+STAGE_TIMEOUTS = {
+    "entities": float(os.getenv("TIMEOUT_ENTITIES", "15")),
+    "query": float(os.getenv("TIMEOUT_QUERY", "10")),
+    "response": float(os.getenv("TIMEOUT_RESPONSE", "45")),
+}
+
+# supabase-py is synchronous, so its calls run on a bounded pool instead of the event loop
+blocking_pool = ThreadPoolExecutor(max_workers=int(os.getenv("BLOCKING_POOL_SIZE", "16")), thread_name_prefix="rag-blocking")
+
+# Upper bound on the retrieved-data portion of the step 5 prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+
+# Plain dicts so google.genai.types is only imported along with the client
+ENTITY_CONFIG = {"response_mime_type": "application/json", "temperature": 0.1}
+PLAN_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "primary_name": {"type": "STRING", "nullable": True},
+        "category_name": {"type": "STRING", "nullable": True},
+        "query": {
+            "type": "OBJECT",
+            "nullable": True,
+            "properties": {
+                "table": {"type": "STRING", "enum": sorted(DB_COLUMNS)},
+                "select": {"type": "ARRAY", "items": {"type": "STRING"}},
+                "filters": {
+                    "type": "ARRAY",
+                    "items": {
+                        "type": "OBJECT",
+                        "properties": {
+                            "op": {"type": "STRING", "enum": sorted(ALLOWED_OPS)},
+                            "column": {"type": "STRING"},
+                            "value": {"type": "STRING"},
+                            "values": {"type": "ARRAY", "items": {"type": "STRING"}},
+                        },
+                        "required": ["op", "column"],
+                    },
+                },
+                "order": {"type": "STRING"},
+                "desc": {"type": "BOOLEAN"},
+                "limit": {"type": "INTEGER"},
+                "aggregate": {"type": "STRING", "enum": sorted(AGGREGATE_KEYWORDS), "nullable": True},
+            },
+            "required": ["table", "select", "filters"],
+        },
+    },
+    "required": ["primary_name", "category_name"],
+}
+PLAN_CONFIG = {"response_mime_type": "application/json", "response_schema": PLAN_SCHEMA, "temperature": 0.1}
+BATCH_ENTITY_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "index": {"type": "INTEGER"},
+            "primary_name": {"type": "STRING", "nullable": True},
+            "category_name": {"type": "STRING", "nullable": True},
+        },
+        "required": ["index", "primary_name", "category_name"],
+    },
+}
+BATCH_ENTITY_CONFIG = {"response_mime_type": "application/json", "response_schema": BATCH_ENTITY_SCHEMA, "temperature": 0.1}
+RESPONSE_CONFIG = {"temperature": 0.7}
+
+# tech_metrics changes weekly, so retrieval is served from an in-memory columnar snapshot
+SNAPSHOT_ENABLED = os.getenv("METRICS_SNAPSHOT", "1") != "0"
+metrics_snapshot = MetricsSnapshot(
+    os.getenv("METRICS_SNAPSHOT_PATH", os.path.join(CACHE_DIR, "tech_metrics_snapshot.npz")),
+    refresh_interval=float(os.getenv("METRICS_SNAPSHOT_REFRESH", "900")),
+)
+
+def latest_iso_week():
+    """Newest iso_week present in tech_metrics; the answer cache keys on it."""
+    if SNAPSHOT_ENABLED and metrics_snapshot.loaded:
+        return metrics_snapshot.watermark
+    rows = get_supabase().table("tech_metrics").select("iso_week").order("iso_week", desc=True).limit(1).execute().data
+    return rows[0]["iso_week"] if rows else None
+
+# Replies for data-backed answers, invalidated automatically when a new week lands
+answer_cache = AnswerCache(
+    make_backend(os.getenv("ANSWER_CACHE_URL"), int(os.getenv("ANSWER_CACHE_SIZE", "2048"))),
+    latest_iso_week,
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", "21600")),
+    similarity=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.9")),
+)
+
+async def run_blocking(fn, *args, **kwargs):
+    """Runs a blocking call on the bounded pool without stalling the event loop."""
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context (request id) onto the worker thread
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(blocking_pool, functools.partial(ctx.run, fn, *args, **kwargs))
+
+async def with_timeout(stage: str, awaitable):
+    """Awaits a pipeline stage, enforcing its deadline from STAGE_TIMEOUTS."""
+    try:
+        return await asyncio.wait_for(awaitable, STAGE_TIMEOUTS[stage])
+    except asyncio.TimeoutError:
+        print(f"    [!] Stage '{stage}' exceeded {STAGE_TIMEOUTS[stage]}s")
+        raise
+
+def _warm_supabase():
+    if SNAPSHOT_ENABLED:
+        # Loading the snapshot also proves the database is reachable
+        metrics_snapshot.ensure_fresh(get_supabase())
+    else:
+        latest_iso_week()
+
+async def awarm_up() -> dict:
+    """Loads the catalog and opens the Supabase and Gemini connections; returns per-dependency status."""
+    checks = {}
+    for name, warm in (
+        ("catalog", lambda: run_blocking(get_catalog)),
+        ("supabase", lambda: with_timeout("query", run_blocking(_warm_supabase))),
+        ("gemini", lambda: with_timeout("entities", get_client().aio.models.get(model=MODEL_NAME))),
+    ):
+        try:
+            await warm()
+            checks[name] = "ok"
+        except Exception as e:
+            checks[name] = f"error: {type(e).__name__}: {e}"
+    return checks
+
+def _resolve_locally(user_query: str):
+    """Returns (entities, match); entities is None when the query needs the LLM to disambiguate."""
+    match = get_entity_resolver().resolve(user_query)
+    if match.status == "ambiguous":
+        return None, match
+    print(f"    -> Resolved locally ({match.status}, confidence {match.confidence:.2f})")
+    return {
+        "primary_name": match.primary_name,
+        "category_name": match.category_name,
+        "resolved_by": "local",
+    }, match
+
+def _entity_prompt(user_query: str, candidates: list) -> str:
+    # Only the shortlisted candidates are sent, keeping the prompt small
+    return f"""
     You are an entity extraction module. 
     User Query: "{user_query}"
     
-    Using this JSON catalog of valid technologies: {json.dumps(tech_catalog)}
+    Using this JSON catalog of valid technologies: {json.dumps(candidates)}
     
     Identify which specific technology the user is asking about.
     Return strictly a JSON object with two keys:
@@ -61,88 +260,397 @@ def step_2_identify_entities(user_query: str) -> dict:
     - "category_name": The exact category from the catalog.
     If no match is found, return null for both.
     """
-    
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=prompt,
-        config=types.GenerateContentConfig(
-            response_mime_type="application/json",
-            temperature=0.1
-        )
-    )
-    return json.loads(response.text)
-
-def step_3_generate_supabase_query(primary_name: str, category_name: str, user_query: str) -> str:
-    """Uses LLM to generate Supabase python client code to fetch the right data."""
-    print(" [Step 3] 🏗️ Generating dynamic Supabase query...")
-    
-    prompt = f"""
-    You are a Supabase-Py Query Architect. 
-    User Question: "{user_query}"
-    Identified Tech: "{primary_name}"
-    Category: "{category_name}"
-    
-    Database Schema available:
+
+def _parse_entities(text: str) -> dict:
+    entities = json.loads(text)
+    entities["resolved_by"] = "llm"
+    return entities
+
+def _plan_prompt(user_query: str, candidates: list) -> str:
+    # Entity extraction and query planning in one structured call
+    return f"""
+    You are the planning module of a technology-trends assistant.
+    User Query: "{user_query}"
+
+    Valid technologies (JSON): {json.dumps(candidates)}
+
+    Database schema:
     {DB_SCHEMA}
-    
-    Generate Python code using the official `supabase-py` syntax to retrieve the answer.
-    - The Supabase client is already initialized as the variable `supabase`.
-    - You MUST assign the final data result to a variable named `retrieved_data`.
-    - Example: 
-      response = supabase.table('tech_metrics').select('*').eq('topic_name', '{primary_name}').order('iso_week', desc=True).execute()
-      retrieved_data = response.data
-    
-    Return ONLY valid, highly secure Python code. Do not use markdown backticks (```) or any explanations. Just the code.
+
+    Return a JSON object with:
+    - "primary_name": the exact primary_name from the list the user is asking about, or null.
+    - "category_name": that technology's exact category, or null.
+    - "query": a declarative query spec answering the question, or null if primary_name is null:
+      - "table": "tech_metrics"
+      - "select": the metric columns needed (jobs, github, trends, news)
+      - "filters": a list of {{"op", "column", "value"}} (or "values" for op "in_"); ops are {", ".join(sorted(ALLOWED_OPS))}.
+        Always filter topic_name by the exact primary_name (op "in_" when comparing technologies).
+        Weeks are strings like '2025-W12'.
+      - "order": a column (normally "iso_week"), "desc": true for newest first
+      - "limit": the number of rows (weeks x technologies; 12 weeks if unspecified)
+      - "aggregate": "mean", "sum", "max" or "min" when the user asks for an average/total/peak/lowest, else null
     """
-    
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=prompt,
-        config=types.GenerateContentConfig(temperature=0.1)
-    )
-    
-    # Clean up markdown if the LLM leaked it
-    code = response.text.strip()
-    if code.startswith("```python"): code = code[9:]
-    elif code.startswith("```"): code = code[3:]
-    if code.endswith("```"): code = code[:-3]
-    return code.strip()
-
-def step_4_execute_query(code: str):
-    """Executes the generated Supabase query code securely."""
+
+def _parse_plan(text: str) -> dict:
+    """Entities from a fused planning reply; a valid query spec is compiled into entities["query_plan"]."""
+    entities = _parse_entities(text)
+    spec = entities.pop("query", None)
+    if entities.get("primary_name") and spec:
+        try:
+            entities["query_plan"] = plan_from_spec(spec, DB_COLUMNS, get_catalog()["topics"], entities["primary_name"])
+        except (ValueError, TypeError) as e:
+            # The deterministic planner takes over in step 3
+            print(f"    [!] Rejected LLM query spec: {e}")
+    return entities
+
+def _generate(sp, prompt: str, config):
+    """Yields one generate_content request and records the reply on sp; returns the response."""
+    response = yield {"model": MODEL_NAME, "contents": prompt, "config": config}
+    sp.set(prompt_chars=len(prompt), response_chars=len(response.text or "")).record_llm_usage(response)
+    return response
+
+def _drive(flow):
+    """Runs an LLM step (a generator of generate_content requests) on the sync client."""
+    try:
+        request = next(flow)
+        while True:
+            try:
+                response = get_client().models.generate_content(**request)
+            except BaseException as e:
+                # Raised inside the step, so its span records the failure
+                request = flow.throw(e)
+                continue
+            request = flow.send(response)
+    except StopIteration as done:
+        return done.value
+
+async def _adrive(flow, stage: str):
+    """Runs an LLM step on the async client, each call under the stage's timeout."""
+    try:
+        request = next(flow)
+        while True:
+            try:
+                response = await with_timeout(stage, get_client().aio.models.generate_content(**request))
+            except BaseException as e:
+                request = flow.throw(e)
+                continue
+            request = flow.send(response)
+    except StopIteration as done:
+        return done.value
+
+def _entities_flow(user_query: str):
+    with span("entities") as sp:
+        entities, match = _resolve_locally(user_query)
+        if entities:
+            sp.set(resolved_by="local", status=match.status)
+            return entities
+
+        fused = PLANNING_MODE == "fused"
+        prompt = (_plan_prompt if fused else _entity_prompt)(user_query, match.candidates)
+        sp.set(resolved_by="llm", fused=fused)
+        response = yield from _generate(sp, prompt, PLAN_CONFIG if fused else ENTITY_CONFIG)
+        return (_parse_plan if fused else _parse_entities)(response.text)
+
+def step_2_identify_entities(user_query: str) -> dict:
+    """Resolves the tech name locally via the alias index, falling back to the LLM only for ambiguous queries.
+
+    In fused planning mode the LLM call also returns a validated query plan under "query_plan".
+    """
+    print(" [Step 2] 🧠 Identifying technology entities...")
+    return _drive(_entities_flow(user_query))
+
+async def astep_2_identify_entities(user_query: str) -> dict:
+    """Async variant of step 2 using the non-blocking Gemini client."""
+    print(" [Step 2] 🧠 Identifying technology entities...")
+    return await _adrive(_entities_flow(user_query), "entities")
+
+def _batch_entity_prompt(items: list) -> str:
+    # One shared candidate list for every ambiguous question in the batch
+    candidates = list({c["primary_name"]: c for _, _, cands in items for c in cands}.values())
+    questions = "\n".join(f'    {i}. "{q}"' for i, q, _ in items)
+    return f"""
+    You are an entity extraction module.
+    User Queries (numbered):
+{questions}
+
+    Using this JSON catalog of valid technologies: {json.dumps(candidates)}
+
+    For each query, identify which specific technology the user is asking about.
+    Return strictly a JSON array with one object per query, with keys:
+    - "index": the query number.
+    - "primary_name": The exact primary_name from the catalog.
+    - "category_name": The exact category from the catalog.
+    If no match is found for a query, return null for both names.
+    """
+
+async def astep_2_identify_entities_batch(queries: list) -> list:
+    """Step 2 for many queries: local resolution for each, then one LLM call covering every ambiguous one."""
+    print(f" [Step 2] 🧠 Identifying technology entities for {len(queries)} queries...")
+
+    results = [None] * len(queries)
+    with span("entities_batch", queries=len(queries)) as sp:
+        ambiguous = []
+        for i, user_query in enumerate(queries):
+            entities, match = _resolve_locally(user_query)
+            if entities:
+                results[i] = entities
+            else:
+                ambiguous.append((i, user_query, match.candidates))
+        sp.set(llm_queries=len(ambiguous))
+
+        if ambiguous:
+            prompt = _batch_entity_prompt(ambiguous)
+            try:
+                response = await with_timeout("entities", get_client().aio.models.generate_content(
+                    model=MODEL_NAME,
+                    contents=prompt,
+                    config=BATCH_ENTITY_CONFIG
+                ))
+                sp.set(prompt_chars=len(prompt), response_chars=len(response.text or "")).record_llm_usage(response)
+                topics = get_catalog()["topics"]
+                for item in json.loads(response.text):
+                    i = item.get("index")
+                    if isinstance(i, int) and 0 <= i < len(results) and results[i] is None:
+                        name = item.get("primary_name")
+                        results[i] = {
+                            "primary_name": name if name in topics else None,
+                            "category_name": item.get("category_name") if name in topics else None,
+                            "resolved_by": "llm",
+                        }
+            except Exception as e:
+                print(f"    [!] Batch entity extraction failed: {e}")
+                for i, _, _ in ambiguous:
+                    results[i] = {"primary_name": None, "category_name": None, "resolved_by": "llm", "error": str(e) or type(e).__name__}
+
+    # A query the model skipped is treated as matching nothing
+    return [r or {"primary_name": None, "category_name": None, "resolved_by": "llm"} for r in results]
+
+def step_3_plan_query(primary_name: str, user_query: str, llm_plan: QueryPlan | None = None) -> QueryPlan:
+    """Picks a parameterized tech_metrics query shape from the resolved entity and the question's intent.
+
+    A plan already produced and validated by fused planning in step 2 is used as-is.
+    """
+    print(" [Step 3] 🏗️ Planning Supabase query...")
+
+    if llm_plan is not None:
+        print(f"    -> Query shape: {llm_plan.shape} (planned with entity extraction)")
+        return llm_plan
+
+    with span("plan") as sp:
+        # A comparison needs every topic the user named, with the resolved one first
+        mentioned = [t["primary_name"] for t in get_entity_resolver().resolve_all(user_query)]
+        plan = plan_query([primary_name] + mentioned, user_query)
+        sp.set(shape=plan.shape)
+    print(f"    -> Query shape: {plan.shape}")
+    return plan
+
+def _query_snapshot(plan: QueryPlan):
+    try:
+        metrics_snapshot.ensure_fresh(get_supabase())
+    except Exception as e:
+        print(f"    [!] Snapshot refresh failed, querying Supabase directly: {e}")
+        return None
+    return metrics_snapshot.execute_plan(plan) if metrics_snapshot.loaded else None
+
+def step_4_execute_query(plan: QueryPlan):
+    """Executes the planned query, from the in-memory snapshot when possible, otherwise against Supabase."""
     print(" [Step 4] 📡 Executing query on Supabase...")
     
-    # Provide the execution environment
-    local_vars = {"supabase": supabase}
     try:
-        exec(code, {}, local_vars)
-        return local_vars.get("retrieved_data", [])
+        with span("query", shape=plan.shape) as sp:
+            rows = _query_snapshot(plan) if SNAPSHOT_ENABLED else None
+            if rows is not None:
+                print(f"    -> Served from snapshot (watermark {metrics_snapshot.watermark})")
+                sp.set(source="snapshot")
+            else:
+                rows = execute_plan(get_supabase(), plan)
+                sp.set(source="supabase")
+            sp.set(rows=len(rows), payload_bytes=len(json.dumps(rows, default=str)))
+            return rows
     except Exception as e:
         print(f"    [!] Query Execution Failed: {e}")
-        print(f"    [!] Code attempted:\n{code}")
-        return {"error": str(e), "code_attempted": code}
+        print(f"    [!] Plan attempted: {plan}")
+        return {"error": str(e), "plan_attempted": plan._asdict()}
 
-def step_5_generate_human_response(user_query: str, retrieved_data: any) -> str:
-    """Converts the raw JSON data into a conversational response."""
-    print(" [Step 5] 💬 Formulating conversational insights...")
-    
-    prompt = f"""
+async def astep_4_execute_query(plan: QueryPlan):
+    """Async variant of step 4; the blocking supabase call runs on the bounded pool."""
+    return await with_timeout("query", run_blocking(step_4_execute_query, plan))
+
+def _from_merged(fetched: MetricsSnapshot, plan: QueryPlan):
+    """The plan's rows out of the merged fetch, or None when that window may be truncated.
+
+    An open-ended plan ("last N weeks") was merged as the N weeks before the watermark; a topic
+    whose data stops earlier, or has gaps, holds fewer than N of its rows there and is re-queried.
+    """
+    bounded = any(column == "iso_week" and op in ("gte", "eq") for op, column, _ in plan.filters)
+    if plan.limit and not bounded:
+        topics = plan_topics(plan)
+        per_topic = -(-plan.limit // max(1, len(topics)))
+        window = fetched.execute_plan(plan._replace(limit=None, aggregate=None)) or []
+        counts = {}
+        for row in window:
+            counts[row.get("topic_name")] = counts.get(row.get("topic_name"), 0) + 1
+        if any(counts.get(t, 0) < per_topic for t in topics):
+            return None
+    return fetched.execute_plan(plan)
+
+def step_4_execute_batch(plans: list) -> list:
+    """Step 4 for many plans: snapshot first, then one merged in_() query for everything else.
+
+    Results are in plan order; an item that fails comes back as step 4's error dict.
+    """
+    print(f" [Step 4] 📡 Executing {len(plans)} queries...")
+
+    results = [None] * len(plans)
+    with span("query_batch", plans=len(plans)) as sp:
+        pending = []
+        for i, plan in enumerate(plans):
+            rows = _query_snapshot(plan) if SNAPSHOT_ENABLED else None
+            if rows is not None:
+                results[i] = rows
+            else:
+                pending.append(i)
+        sp.set(from_snapshot=len(plans) - len(pending))
+
+        round_trips, fetched = 0, None
+        try:
+            # The watermark read can fail too; either way each plan is then queried on its own
+            merged = merge_plans([plans[i] for i in pending], answer_cache.latest_week()) if pending else None
+            if merged:
+                round_trips += 1
+                fetched = MetricsSnapshot.from_rows(execute_plan(get_supabase(), merged, page_size=1000))
+                print(f"    -> One query for {len(pending)} plans over {len(merged.filters[0][2])} topics")
+        except Exception as e:
+            print(f"    [!] Merged batch query failed, querying one by one: {e}")
+
+        for i in pending:
+            rows = _from_merged(fetched, plans[i]) if fetched else None
+            if not rows:
+                # Unmergeable, or the merged window is short for one of its topics
+                round_trips += 1
+                rows = step_4_execute_query(plans[i])
+            results[i] = rows
+        sp.set(round_trips=round_trips)
+    return results
+
+async def astep_4_execute_batch(plans: list) -> list:
+    """Async variant of the batched step 4."""
+    return await with_timeout("query", run_blocking(step_4_execute_batch, plans))
+
+def _response_prompt(user_query: str, retrieved_data, sp=None) -> str:
+    context, sizes = compact_rows(retrieved_data, CONTEXT_TOKEN_BUDGET)
+    print(f"    -> Context: {sizes['rows']} rows, ~{sizes['original_tokens']} -> ~{sizes['compacted_tokens']} tokens")
+    if sp:
+        sp.set(context_tokens_original=sizes["original_tokens"], context_tokens_compacted=sizes["compacted_tokens"])
+    return f"""
     The user asked: "{user_query}"
     
-    You queried the database and retrieved this raw JSON data:
-    {json.dumps(retrieved_data, default=str)}
+    You queried the database and retrieved this JSON data (raw rows, or a per-metric summary with
+    latest values, week-over-week deltas, min/max, slope per week and a downsampled series):
+    {json.dumps(context, default=str)}
     
     Convert this raw data into a highly conversational, insightful, and professional response. 
     Do not mention the database or the JSON format. 
     Read the numbers and explain what they mean to the user directly.
     """
+
+def _response_flow(user_query: str, retrieved_data):
+    with span("response") as sp:
+        response = yield from _generate(sp, _response_prompt(user_query, retrieved_data, sp), RESPONSE_CONFIG)
+        return response.text
+
+def step_5_generate_human_response(user_query: str, retrieved_data: any) -> str:
+    """Converts the raw JSON data into a conversational response."""
+    print(" [Step 5] 💬 Formulating conversational insights...")
+    return _drive(_response_flow(user_query, retrieved_data))
+
+async def astep_5_generate_human_response(user_query: str, retrieved_data: any) -> str:
+    """Async variant of step 5 using the non-blocking Gemini client."""
+    print(" [Step 5] 💬 Formulating conversational insights...")
+    return await _adrive(_response_flow(user_query, retrieved_data), "response")
+
+async def _astream_text(stage: str, user_query: str, build_prompt):
+    with span(stage, streamed=True) as sp:
+        prompt = build_prompt(sp)
+        # The deadline covers time-to-first-chunk; once tokens flow the stream runs to completion
+        stream = await with_timeout("response", get_client().aio.models.generate_content_stream(
+            model=MODEL_NAME,
+            contents=prompt,
+            config=RESPONSE_CONFIG
+        ))
+        chars, last = 0, None
+        async for chunk in stream:
+            if chunk.text:
+                if not chars:
+                    sp.set(first_token_ms=round((time.perf_counter() - sp.started) * 1000, 2))
+                chars += len(chunk.text)
+                yield chunk.text
+            last = chunk
+        sp.set(prompt_chars=len(prompt), response_chars=chars).record_llm_usage(last)
+
+def astream_human_response(user_query: str, retrieved_data: any):
+    """Streaming variant of step 5; returns an async iterator of answer text chunks."""
+    print(" [Step 5] 💬 Streaming conversational insights...")
+    return _astream_text("response", user_query, lambda sp: _response_prompt(user_query, retrieved_data, sp))
+
+async def adata_only_answer(user_query: str):
+    """Answers without any LLM call, for shed requests: local entity match, then the answer cache,
+    then a templated summary of the retrieved metrics. Returns (reply or None, entities)."""
+    print(" [Degraded] 📉 Answering without the LLM...")
+
+    with span("degraded") as sp:
+        entities, _ = _resolve_locally(user_query)
+        primary_name = (entities or {}).get("primary_name")
+        if not primary_name:
+            sp.set(source="none")
+            return None, entities or {}
+
+        plan = step_3_plan_query(primary_name, user_query)
+        cached_reply, _ = await run_blocking(answer_cache.lookup, primary_name, plan, user_query)
+        if cached_reply is not None:
+            sp.set(source="cache")
+            return cached_reply, entities
+
+        rows = await astep_4_execute_query(plan)
+        if not rows or (isinstance(rows, dict) and "error" in rows):
+            sp.set(source="none")
+            return None, entities
+        sp.set(source="data")
+        return ("Our assistant is busy right now, so here are the latest tracked numbers:\n"
+                + describe_rows(rows)), entities
+
+def _fallback_prompt(user_query: str, primary_name: str | None) -> str:
+    if primary_name:
+        context = f'The question is about "{primary_name}", which we track but have no recorded metrics for in this context.'
+    else:
+        context = "The question does not match any technology in our tracked catalog."
+    return f"""
+    The user asked: "{user_query}"
+    {context}
     
-    response = client.models.generate_content(
-        model=MODEL_NAME,
-        contents=prompt,
-        config=types.GenerateContentConfig(temperature=0.7)
-    )
-    return response.text
+    Answer from your general knowledge of the technology landscape in a conversational, professional tone.
+    Make it clear that this answer is not backed by our tracked trend metrics.
+    """
+
+def _fallback_flow(user_query: str, primary_name: str | None):
+    with span("fallback") as sp:
+        response = yield from _generate(sp, _fallback_prompt(user_query, primary_name), RESPONSE_CONFIG)
+        return response.text
+
+def step_fallback_general_knowledge(user_query: str, primary_name: str | None = None) -> str:
+    """Answers from the model's general knowledge when no tracked data is available."""
+    print(" [Fallback] 📚 Answering from general knowledge...")
+    return _drive(_fallback_flow(user_query, primary_name))
+
+async def astep_fallback_general_knowledge(user_query: str, primary_name: str | None = None) -> str:
+    """Async variant of the general-knowledge fallback."""
+    print(" [Fallback] 📚 Answering from general knowledge...")
+    return await _adrive(_fallback_flow(user_query, primary_name), "response")
+
+def astream_fallback_general_knowledge(user_query: str, primary_name: str | None = None):
+    """Streaming variant of the general-knowledge fallback."""
+    print(" [Fallback] 📚 Streaming answer from general knowledge...")
+    return _astream_text("fallback", user_query, lambda sp: _fallback_prompt(user_query, primary_name))
 
 def main():
     print("\n" + "="*60)
@@ -158,19 +666,20 @@ def main():
             
             # Step 2: Extract entities
             entities = step_2_identify_entities(user_query)
+            llm_plan = entities.pop("query_plan", None)
             primary_name = entities.get("primary_name")
             category_name = entities.get("category_name")
-            print(f"    -> Mapped to: {primary_name} ({category_name})")
+            print(f"    -> Mapped to: {primary_name} ({category_name}) via {entities.get('resolved_by')}")
             
             if not primary_name:
                 print("\n🤖 I couldn't find a matching technology in the master catalog. Please try rephrasing.")
                 continue
                 
-            # Step 3: Generate query
-            query_code = step_3_generate_supabase_query(primary_name, category_name, user_query)
+            # Step 3: Plan query
+            plan = step_3_plan_query(primary_name, user_query, llm_plan)
             
             # Step 4: Execute query
-            retrieved_data = step_4_execute_query(query_code)
+            retrieved_data = step_4_execute_query(plan)
             if not retrieved_data:
                 print("\n🤖 I queried the database but found no specific records for this technology in that context.")
                 continue
@@ -0,0 +1,153 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+
+from metrics_snapshot import MetricsSnapshot
+from query_planner import METRICS, parse_intent, plan_topics
+
+# Wording that points back at the previous turn ("and what about GitHub?", "compare that to...")
+FOLLOW_UP_RE = re.compile(
+    r"^\s*(and|also|what about|how about|now|then|ok|okay|so|same)\b"
+    r"|\b(that|it|its|this|those|these|them|same|there|previous|before|instead)\b",
+    re.I,
+)
+# An ambiguous match below this confidence only hit an incidental word ("GitHub activity"
+# brushing a synonym), so back-referencing wording outweighs it
+WEAK_MATCH_CONFIDENCE = 0.4
+
+
+def _plan_metrics(plan) -> set:
+    selected = [c.strip() for c in plan.select.split(",")]
+    return set(METRICS) if "*" in selected else {m for m in METRICS if m in selected}
+
+
+def _week_bounds(plan):
+    lower = upper = None
+    for op, column, value in plan.filters:
+        if column == "iso_week" and op in ("gte", "gt", "eq"):
+            lower = value
+        if column == "iso_week" and op in ("lte", "lt", "eq"):
+            upper = value
+    return lower, upper
+
+
+def covers(prior_plan, rows: list, plan) -> bool:
+    """Whether rows fetched for prior_plan are guaranteed to contain everything plan asks for."""
+    if prior_plan is None or prior_plan.aggregate or not rows or plan.table != prior_plan.table:
+        # Aggregate rows cannot be re-sliced into another window
+        return False
+    if any(c not in ("topic_name", "iso_week") for p in (prior_plan, plan) for _, c, _ in p.filters):
+        # Value filters (e.g. jobs > 100) make the rows a subset no window check can reason about
+        return False
+    if not plan_topics(plan) <= plan_topics(prior_plan) or not _plan_metrics(plan) <= _plan_metrics(prior_plan):
+        return False
+
+    prior_lower, prior_upper = _week_bounds(prior_plan)
+    lower, upper = _week_bounds(plan)
+    if prior_upper and (not upper or upper > prior_upper):
+        return False
+
+    # Fewer rows than the limit means the prior window was fetched to its start
+    exhausted = not prior_plan.limit or len(rows) < prior_plan.limit
+    per_topic = {}
+    for row in rows:
+        per_topic.setdefault(row.get("topic_name"), []).append(row["iso_week"])
+    for topic in plan_topics(plan):
+        weeks = per_topic.get(topic)
+        if not weeks:
+            return False
+        earliest = prior_lower if exhausted else min(weeks)
+        if lower:
+            if earliest and lower < earliest:
+                return False
+        elif not (exhausted and not prior_lower):
+            # An open-ended window needs at least `limit` rows per topic on hand
+            needed = -(-plan.limit // len(plan_topics(plan))) if plan.limit else None
+            if needed is None or len(weeks) < needed:
+                return False
+    return True
+
+
+def answer_from_rows(prior_plan, rows: list, plan) -> list | None:
+    """Re-slices a previous turn's dataset for a follow-up plan; None when it must be re-fetched."""
+    if not covers(prior_plan, rows, plan):
+        return None
+    return MetricsSnapshot.from_rows(rows).execute_plan(plan)
+
+
+class SessionStore:
+    """Bounded LRU of per-session conversation state: last resolved entity, plan and dataset."""
+
+    def __init__(self, max_sessions: int = 5000, ttl: float = 1800.0, max_rows: int = 1000):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_rows = max_rows
+        self.counters = {"follow_ups": 0, "reused": 0, "refetched": 0, "evictions": 0}
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str | None) -> dict | None:
+        if not key:
+            return None
+        with self._lock:
+            state = self._sessions.get(key)
+            if state is None:
+                return None
+            if time.monotonic() - state["updated"] > self.ttl:
+                del self._sessions[key]
+                return None
+            self._sessions.move_to_end(key)
+            return state
+
+    def remember(self, key: str | None, entities: dict, plan=None, rows: list | None = None):
+        """Records the turn's topic; a dataset is kept until a turn fetches a new one."""
+        if not key or not entities.get("primary_name"):
+            return
+        if rows is not None and len(rows) > self.max_rows:
+            rows = None
+        with self._lock:
+            previous = self._sessions.get(key)
+            state = {"entities": entities, "plan": plan, "rows": rows, "updated": time.monotonic()}
+            if rows is None and previous and previous["entities"].get("primary_name") == entities["primary_name"]:
+                state["plan"], state["rows"] = previous["plan"], previous["rows"]
+            self._sessions[key] = state
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def follow_up_entities(self, state: dict | None, user_query: str, match) -> dict | None:
+        """The previous turn's entities when this query continues the same topic, else None.
+
+        `match` is the local resolver's result for the query. Naming the prior topic again,
+        naming nothing while using back-referencing wording, or comparing the prior topic
+        against a new one ("compare that to LiDAR") all count as follow-ups. So does an
+        ambiguous match with back-referencing wording when it is weak or its candidates
+        include the prior topic; any other ambiguous match is left to step 2.
+        """
+        if not state:
+            return None
+        prior = state["entities"]
+        refers_back = bool(FOLLOW_UP_RE.search(user_query))
+        if match.status == "matched":
+            if match.primary_name != prior.get("primary_name") and not (
+                    refers_back and parse_intent(user_query, 2).shape == "compare"):
+                return None
+        elif not refers_back:
+            return None
+        elif match.status == "ambiguous" and match.confidence >= WEAK_MATCH_CONFIDENCE:
+            if prior.get("primary_name") not in {c.get("primary_name") for c in match.candidates}:
+                return None
+        self.counters["follow_ups"] += 1
+        return dict(prior, resolved_by="session")
+
+    def reuse(self, state: dict, plan) -> list | None:
+        """Rows for a follow-up's plan cut from the session's dataset, or None to re-fetch."""
+        rows = answer_from_rows(state["plan"], state["rows"], plan) if state.get("rows") else None
+        self.counters["reused" if rows else "refetched"] += 1
+        return rows or None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters, sessions=len(self._sessions))
@@ -0,0 +1,96 @@
+"""
+Admission paths of chat_api, run in-process against the offline benchmark's stubs
+(no Gemini, no Supabase).  Run:  python -m pytest tests
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("TRACE_LOG", "0")
+
+import httpx
+import pytest
+
+import bench_chat_api
+import chat_api
+import rag_pipeline
+from admission_control import RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def offline_pipeline(monkeypatch):
+    rag_pipeline.configure(
+        client=bench_chat_api.StubGemini(bench_chat_api.StubModels(0.0, 0.0, 5)),
+        supabase=bench_chat_api.FakeSupabase(rag_pipeline.tech_catalog, 12, 0.0),
+    )
+    bench_chat_api.reset_state(use_cache=False, use_snapshot=True)
+    # Effectively no refill during a test
+    monkeypatch.setattr(chat_api, "rate_limiter", RateLimiter(rate=1e-3, burst=2))
+    monkeypatch.setattr(chat_api, "address_limiter", RateLimiter(rate=1e-3, burst=4))
+
+
+def post(path, payload):
+    async def send():
+        transport = httpx.ASGITransport(app=chat_api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post(path, json=payload)
+    return asyncio.run(send())
+
+
+def sse_events(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_rate_limited_stream_degrades_to_data_only_reply():
+    chat_api.rate_limiter.allow("alice", 2)
+    resp = post("/chat/stream", {"message": "How is LiDAR trending?", "user_id": "alice"})
+
+    assert resp.status_code == 200
+    events = sse_events(resp.text)
+    assert events[0] == ("stage", {"stage": "degraded", "reason": "rate_limited"})
+    assert events[-1][0] == "done" and events[-1][1]["degraded"]
+    assert "LiDAR" in events[-1][1]["reply"]
+
+
+def test_rate_limit_is_per_user_not_per_session():
+    chat_api.rate_limiter.allow("bob", 2)
+    resp = post("/chat", {"message": "Tell me a joke", "user_id": "bob", "session_id": "fresh-session"})
+
+    assert resp.status_code == 429
+    assert resp.json()["reason"] == "rate_limited"
+
+
+def test_batch_over_burst_is_charged_in_full():
+    resp = post("/chat/batch", {"messages": ["How is LiDAR trending?"] * 4, "user_id": "carol"})
+    assert resp.status_code == 200
+    assert all(r["error"] is None for r in resp.json()["results"])
+
+    # The bucket is now two tokens in debt: the next request waits for three tokens of refill
+    resp = post("/chat", {"message": "Tell me a joke", "user_id": "carol"})
+    assert resp.status_code == 429
+    assert int(resp.headers["Retry-After"]) >= 2900
+
+
+def test_rotating_user_ids_share_the_address_budget():
+    statuses = [post("/chat", {"message": "Tell me a joke", "user_id": f"user-{i}"}).status_code for i in range(5)]
+
+    assert statuses == [200, 200, 200, 200, 429]
+
+
+def test_degraded_batch_items_are_stored_in_history(monkeypatch):
+    stored = []
+    monkeypatch.setattr(chat_api, "_store_history", lambda user_id, query, reply: stored.append((user_id, query)))
+    chat_api.rate_limiter.allow("dave", 2)
+    resp = post("/chat/batch", {"messages": ["How is LiDAR trending?", "Tell me a joke"], "user_id": "dave"})
+
+    results = resp.json()["results"]
+    assert [r["degraded"] for r in results] == [True, True]
+    assert results[0]["reply"] and results[1]["reply"] is None
+    assert stored == [("dave", "How is LiDAR trending?")]